@@ -1,23 +1,69 @@
-
-from fastapi import FastAPI,Response
+from fastapi import FastAPI,Request,HTTPException,Depends
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 import motor.motor_asyncio
 import os
+from collections import OrderedDict
 from dotenv import load_dotenv
+load_dotenv()
 from google import genai
 from prompt import create_advice_prompt_multiple, create_user_question_prompt
 from gtts import gTTS
-import io
+import json
+import re
+import asyncio
 import uvicorn
-from Weather import get_weather
-latitude, longitude, temperature, weather_desc,city,humidity,rainfall = get_weather()
-from index import get_cropName
-
-load_dotenv()
+from contextlib import asynccontextmanager
+from Weather import close_http_client
+from location_context import DEFAULT_LANG, resolve_location_context, prompt_fields
+from llm_scheduler import LLMScheduler, SchedulerOverloaded
+from llm_cache import LLMResponseCache, prompt_key
+from singleflight import SingleFlight
+from tts_cache import TTSAudioCache, audio_key, audio_response, split_segments, stream_clips
+from chat_writer import ChatLogWriter
+import chat_history
+import hmac
+from firebase_auth import bearer_token, verify_token
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import Weather
 
 MONGO_URI = os.getenv("MONGO_URI")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_MODEL = "gemini-1.5-flash"
+
+# Concurrent Gemini calls, callers allowed to wait for a slot, and per-call timeout in seconds
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+
+# Answers to the canned crop-advice prompt are cached; LLM_CACHE_PATH enables the on-disk backend
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1024"))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH")
+
+# Content-addressed MP3 cache for /api/tts
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "tts_cache"))
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Threads synthesizing TTS clips across all requests, and segments synthesized ahead per stream
+TTS_WORKERS = int(os.getenv("TTS_WORKERS", "8"))
+TTS_STREAM_LOOKAHEAD = int(os.getenv("TTS_STREAM_LOOKAHEAD", "3"))
+
+# Chats are written to MongoDB in the background, in batches of up to CHAT_LOG_BATCH_SIZE
+# at least every CHAT_LOG_FLUSH_INTERVAL seconds, with at most CHAT_LOG_MAX_QUEUE waiting
+CHAT_LOG_BATCH_SIZE = int(os.getenv("CHAT_LOG_BATCH_SIZE", "100"))
+CHAT_LOG_FLUSH_INTERVAL = float(os.getenv("CHAT_LOG_FLUSH_INTERVAL", "1"))
+CHAT_LOG_MAX_QUEUE = int(os.getenv("CHAT_LOG_MAX_QUEUE", "10000"))
+
+# Bearer token that may read and export every user's chat history; unset disables admin access
+HISTORY_ADMIN_TOKEN = os.getenv("HISTORY_ADMIN_TOKEN")
+
+# Comma separated origins allowed to call the API from a browser
+CORS_ORIGINS = os.getenv("CORS_ORIGINS", "*").split(",")
+
+# Per-session state kept in memory, least recently used sessions are dropped first
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "10000"))
 
 print(f" MONGO_URI: {MONGO_URI}")
 print(f" GEMINI_API_KEY configured: {bool(GEMINI_API_KEY)}")
@@ -27,102 +73,330 @@ class OperationModel(BaseModel):
     op_metadata: dict = Field(..., alias="metadata")
     op_done: bool = Field(..., alias="done")
     op_error: str | None = Field(None, alias="error")
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    chat_writer.start()
+    # Build the history indexes in the background so a slow MongoDB doesn't delay startup
+    index_task = asyncio.create_task(create_history_indexes())
+    yield
+    # Flush chats still waiting to be written to MongoDB
+    await chat_writer.stop()
+    index_task.cancel()
+    # Close the pooled weather HTTP client used by get_weather_async
+    await close_http_client()
+    tts_executor.shutdown(wait=False, cancel_futures=True)
+    await llm_cache.close()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=CORS_ORIGINS,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
 
-print(" Connecting to MongoDB...")
-client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URI)
-db = client["chatDB"]
-chat_collection = db["chats"]
-print(" MongoDB client initialized")
+# Heavy clients are created on first use so the app starts without blocking
+_chat_collection = None
+_genai_client = None
 
+def get_chat_collection():
+    global _chat_collection
+    if _chat_collection is None:
+        print(" Connecting to MongoDB...")
+        client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URI)
+        db = client["chatDB"]
+        _chat_collection = db["chats"]
+        print(" MongoDB client initialized")
+    return _chat_collection
 
-print(" Initializing Gemini client...")
-try:
-    genai_client = genai.Client(api_key=GEMINI_API_KEY)
-    print(" Gemini client initialized")
-except Exception as e:
-    print(f" Error initializing Gemini client: {e}")
-    raise
+async def create_history_indexes():
+    try:
+        await chat_history.ensure_indexes(get_chat_collection())
+        print(" Chat history indexes ready")
+    except Exception as e:
+        print(f"⚠ Creating chat history indexes failed: {e}")
+
+def get_genai_client():
+    global _genai_client
+    if _genai_client is None:
+        print(" Initializing Gemini client...")
+        _genai_client = genai.Client(api_key=GEMINI_API_KEY)
+        print(" Gemini client initialized")
+    return _genai_client
 
 class AskRequest(BaseModel):
     question: str = None
+    lat: float | None = None
+    lon: float | None = None
+    lang: str | None = None
+    session_id: str | None = None
+    user_id: str | None = None
+    stream: bool = False  # Stream the answer as Server-Sent Events
+    refresh: bool = False  # Regenerate instead of serving a cached answer
 
 class TTSRequest(BaseModel):
     text: str
+    lang: str | None = None
+    tld: str = "com"
+    slow: bool = False
+    stream: bool = False  # Synthesize sentence by sentence and stream the MP3 as it is ready
+
+llm_scheduler = LLMScheduler(LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE, LLM_TIMEOUT)
+llm_cache = LLMResponseCache(ttl=LLM_CACHE_TTL, maxsize=LLM_CACHE_SIZE, path=LLM_CACHE_PATH)
+llm_flight = SingleFlight()
+chat_writer = ChatLogWriter(
+    get_chat_collection,
+    batch_size=CHAT_LOG_BATCH_SIZE,
+    flush_interval=CHAT_LOG_FLUSH_INTERVAL,
+    max_queue=CHAT_LOG_MAX_QUEUE
+)
+tts_executor = ThreadPoolExecutor(max_workers=TTS_WORKERS, thread_name_prefix="tts")
+tts_cache = TTSAudioCache(TTS_CACHE_DIR, max_bytes=TTS_CACHE_MAX_BYTES, executor=tts_executor)
+
+sessions = OrderedDict()
+
+def get_session(session_id):
+    """Returns the state of a session, creating it (and a session id) if needed."""
+    session_id = session_id or f"session_{os.urandom(16).hex()}"
+    if session_id not in sessions:
+        sessions[session_id] = {
+            "session_id": session_id,
+            "first_prompt_sent": False,
+            "lang": DEFAULT_LANG,
+        }
+        if len(sessions) > MAX_SESSIONS:
+            sessions.popitem(last=False)
+    sessions.move_to_end(session_id)
+    return sessions[session_id]
 
-first_prompt_sent = False  
-print(latitude, longitude, temperature, weather_desc,humidity)
-crop = get_cropName(temperature,humidity,rainfall)
-print(crop)
-initial_data_multiple = {
-    "city":city,
-    "crops": crop,
-    "gps": f"{latitude},{longitude}",
-    "weather": f"{weather_desc}, {temperature}",
-    
-    "lang": "pa"  
-}
 @app.get("/api/crop")
-async def get_crop():
-    return {"recommended_crop": crop}
+async def get_crop(lat: float | None = None, lon: float | None = None):
+    context = await resolve_location_context(lat, lon)
+    return {
+        "recommended_crop": context["crops"][0] if context["crops"] else "No suitable crop found",
+        "ranking": [{"crop": name, "score": score} for name, score in context["crop_ranking"]]
+    }
+
+
+async def history_caller(request: Request):
+    """
+    Authenticates a history request: the HISTORY_ADMIN_TOKEN bearer token is
+    an admin, anything else must be a valid Firebase ID token.
+    """
+    token = bearer_token(request)
+    if HISTORY_ADMIN_TOKEN and hmac.compare_digest(token.encode(), HISTORY_ADMIN_TOKEN.encode()):
+        return {"uid": None, "admin": True}
+    decoded_token = await verify_token(request)
+    return {"uid": decoded_token["uid"], "admin": False}
+
+def history_user(caller, user_id):
+    """The user whose chats a caller may read: admins any (or all), everyone else only their own."""
+    if caller["admin"]:
+        return user_id
+    if user_id and user_id != caller["uid"]:
+        raise HTTPException(status_code=403, detail="Cannot read another user's history")
+    return caller["uid"]
+
+@app.get("/api/history")
+async def get_history(session_id: str | None = None, user_id: str | None = None,
+                      limit: int = chat_history.DEFAULT_PAGE_SIZE, cursor: str | None = None,
+                      caller=Depends(history_caller)):
+    """
+    Past chats of a session or user, newest first. Pass next_cursor back as
+    cursor to get the following page. Users only see their own chats.
+    """
+    user_id = history_user(caller, user_id)
+    try:
+        return await chat_history.fetch_page(get_chat_collection(), session_id, user_id, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/history/export")
+async def export_history(session_id: str | None = None, user_id: str | None = None,
+                         since: datetime | None = None, until: datetime | None = None,
+                         include_prompt: bool = False, caller=Depends(history_caller)):
+    """
+    Streams matching chats as NDJSON, oldest first. Users export their own
+    chats; exports across users and full prompts are for admins only.
+    """
+    user_id = history_user(caller, user_id)
+    if include_prompt and not caller["admin"]:
+        raise HTTPException(status_code=403, detail="include_prompt is only available to admins")
+    return StreamingResponse(
+        chat_history.export_ndjson(get_chat_collection(), session_id, user_id, since, until, include_prompt),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": "attachment; filename=chats.ndjson"}
+    )
 
 
 @app.get("/")
 async def root():
     return {"message": "FastAPI server is running!", "status": "ok"}
 
+@app.get("/api/metrics")
+async def metrics():
+    return {
+        "llm": llm_scheduler.metrics(),
+        "llm_cache": llm_cache.stats(),
+        "llm_singleflight": llm_flight.metrics(),
+        "tts_cache": tts_cache.stats(),
+        "chat_writer": chat_writer.stats(),
+        "weather_cache": Weather.weather_cache.stats(),
+        "sessions": len(sessions),
+    }
+
+async def build_question(req: AskRequest):
+    """
+    Returns the Gemini prompt for a request, the session it belongs to, and
+    whether the answer may be cached (only the canned crop-advice prompt).
+    """
+    session = get_session(req.session_id)
+    if req.lang:
+        session["lang"] = req.lang
+    context = await resolve_location_context(req.lat, req.lon, session["lang"])
+
+    if not req.question or req.question.strip() == "":
+        if not session["first_prompt_sent"]:
+            session["first_prompt_sent"] = True
+        question = create_advice_prompt_multiple(**prompt_fields(context))
+        cacheable = True
+        print(f" Using initial crop recommendation prompt")
+    else:
+        question = create_user_question_prompt(
+            user_question=req.question,
+            city=context["city"],
+            gps=context["gps"],
+            weather=context["weather"],
+            
+            lang=session["lang"]
+        )
+        cacheable = False
+        print(f" Using formatted user question prompt")
+    return question, session, cacheable
+
+async def save_chat(req: AskRequest, session, question, answer):
+    """Queues the chat for the background MongoDB writer."""
+    await chat_writer.put({
+        "question": question,
+        "answer": answer,
+        "user_question": req.question or None,
+        "session_id": session["session_id"],
+        "user_id": req.user_id,
+        "lang": session["lang"],
+        "created_at": datetime.now(timezone.utc)
+    })
+
+async def generate_answer(question, cacheable=False):
+    print(f" Calling Gemini API...")
+    response = await llm_scheduler.run(
+        lambda: get_genai_client().aio.models.generate_content(
+            model=GEMINI_MODEL,
+            contents=question
+        )
+    )
+    answer = response.text
+    print(f" Got Gemini response: {answer[:100]}...")
+    if cacheable and answer:
+        await llm_cache.put(GEMINI_MODEL, question, answer)
+    return answer
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def stream_answer(req: AskRequest, question, session, cacheable=False):
+    """
+    Yields the Gemini answer as SSE "chunk" events as it is generated, then a
+    "done" event with the full answer once it has been queued for MongoDB.
+    A cached answer is sent as a single chunk. SchedulerOverloaded is raised
+    before the first event, so callers can still answer 503.
+    """
+    chunks = []
+    cached = await llm_cache.get(GEMINI_MODEL, question) if cacheable and not req.refresh else None
+    if cached is not None:
+        print(f" Serving cached Gemini response")
+        await save_chat(req, session, question, cached)
+        yield sse_event("chunk", {"text": cached})
+        yield sse_event("done", {"answer": cached, "session_id": session["session_id"]})
+        return
+
+    try:
+        async with llm_scheduler.slot():
+            print(f" Streaming from Gemini API...")
+            stream = await asyncio.wait_for(
+                get_genai_client().aio.models.generate_content_stream(
+                    model=GEMINI_MODEL,
+                    contents=question
+                ),
+                LLM_TIMEOUT
+            )
+            async for chunk in stream:
+                if chunk.text:
+                    chunks.append(chunk.text)
+                    yield sse_event("chunk", {"text": chunk.text})
+    except SchedulerOverloaded:
+        raise
+    except Exception as e:
+        print(f" Error in stream_answer: {e}")
+        yield sse_event("error", {"error": f"Something went wrong: {str(e)}"})
+        return
+
+    answer = "".join(chunks)
+    print(f" Streamed Gemini response: {answer[:100]}...")
+    if cacheable and answer:
+        await llm_cache.put(GEMINI_MODEL, question, answer)
+    await save_chat(req, session, question, answer)
+    yield sse_event("done", {"answer": answer, "session_id": session["session_id"]})
+
+async def prepend(first, events):
+    yield first
+    async for event in events:
+        yield event
+
 @app.post("/api/ask")
 async def ask_question(req: AskRequest):
-    global first_prompt_sent
     print(f" Received request: {req}")
     
     try:
-        if not req.question or req.question.strip() == "":
-            if not first_prompt_sent:
-                first_prompt_sent = True
-            question = create_advice_prompt_multiple(**initial_data_multiple)
-            print(f" Using initial crop recommendation prompt")
+        question, session, cacheable = await build_question(req)
+
+        if req.stream:
+            # Run the stream up to its first event before responding, so a full LLM queue is a 503, not a 200 stream
+            events = stream_answer(req, question, session, cacheable)
+            first = await events.__anext__()
+            return StreamingResponse(
+                prepend(first, events),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
+
+        answer = await llm_cache.get(GEMINI_MODEL, question) if cacheable and not req.refresh else None
+        if answer is not None:
+            print(f" Serving cached Gemini response")
         else:
-            question = create_user_question_prompt(
-                user_question=req.question,
-                city=initial_data_multiple["city"],
-                gps=initial_data_multiple["gps"],
-                weather=initial_data_multiple["weather"],
-                
-                lang="pa" 
+            # Identical prompts already being answered share that Gemini call
+            answer = await llm_flight.do(
+                prompt_key(GEMINI_MODEL, question),
+                lambda: generate_answer(question, cacheable)
             )
-            print(f" Using formatted user question prompt")
 
-        print(f" Calling Gemini API...")
-       
-        response = genai_client.models.generate_content(
-            model="gemini-1.5-flash",
-            contents=question
-        )
-        answer = response.text
-        print(f" Got Gemini response: {answer[:100]}...")
-
-        try:
-            await chat_collection.insert_one({
-                "question": question,
-                "answer": answer
-            })
-            print(" Saved to MongoDB")
-        except Exception as mongo_error:
-            print(f"⚠ MongoDB save failed: {mongo_error}")
-            
+        await save_chat(req, session, question, answer)
         
         print(f" Returning text response")
-        return {"answer": answer}
+        return {"answer": answer, "session_id": session["session_id"]}
 
+    except SchedulerOverloaded as e:
+        print(f" Rejected request: {e}")
+        return JSONResponse(
+            status_code=503,
+            content={"error": "Server busy, please retry shortly"},
+            headers={"Retry-After": "1"}
+        )
+    except asyncio.TimeoutError:
+        print(f" Gemini call timed out after {LLM_TIMEOUT}s")
+        return JSONResponse(status_code=504, content={"error": "The AI model took too long to answer"})
     except Exception as e:
         print(f" Error in ask_question: {e}")
         import traceback
@@ -130,35 +404,66 @@ async def ask_question(req: AskRequest):
         return {"error": f"Something went wrong: {str(e)}"}
 
 @app.post("/api/tts")
-async def text_to_speech(req: TTSRequest):
+async def text_to_speech(req: TTSRequest, request: Request):
     """
     Convert text to speech and return audio file
+
+    Clips are cached on disk by content, so replays are served from disk.
+    The response carries an ETag and a Content-Location that can be fetched
+    with GET for revalidation and range requests. With stream=true the text
+    is synthesized in sentence-sized segments and the MP3 is streamed in
+    order as segments finish.
     """
     print(f" TTS request for text: {req.text[:50]}...")
     
     try:
+        lang = req.lang or DEFAULT_LANG
+
+        def synthesizer(text):
+            def synthesize(file):
+                tts = gTTS(text=text, lang=lang, slow=req.slow, tld=req.tld)
+                tts.write_to_fp(file)
+            return synthesize
+
+        if req.stream:
+            jobs = [
+                (audio_key(segment, lang, req.tld, req.slow), synthesizer(segment))
+                for segment in split_segments(req.text)
+            ]
+            print(f" Streaming TTS in {len(jobs)} segments")
+            return StreamingResponse(
+                stream_clips(tts_cache, jobs, lookahead=TTS_STREAM_LOOKAHEAD),
+                media_type="audio/mpeg",
+                headers={"Content-Disposition": "inline; filename=tts_output.mp3"}
+            )
+
+        key = audio_key(req.text, lang, req.tld, req.slow)
+        file = await tts_cache.open_or_create(key, synthesizer(req.text))
         
-        tts = gTTS(text=req.text, lang=initial_data_multiple["lang"], slow=False, tld='com')
-        audio_bytes = io.BytesIO()
-        tts.write_to_fp(audio_bytes)
-        audio_bytes.seek(0)
-        
-        print(f" TTS generated successfully")
-        return Response(
-            content=audio_bytes.read(),
-            media_type="audio/mpeg",
-            headers={"Content-Disposition": "inline; filename=tts_output.mp3"}
-        )
+        print(f" TTS ready: {key}")
+        response = audio_response(request, file, key)
+        response.headers["Content-Location"] = f"/api/tts/audio/{key}"
+        return response
         
     except Exception as e:
         print(f" Error in TTS: {e}")
         import traceback
         traceback.print_exc()
         return {"error": f"TTS failed: {str(e)}"}
+
+@app.get("/api/tts/audio/{key}")
+async def get_tts_audio(key: str, request: Request):
+    """
+    Serve a cached TTS clip by its key, supporting If-None-Match and Range
+    """
+    file = await asyncio.to_thread(tts_cache.open, key) if re.fullmatch(r"[0-9a-f]{64}", key) else None
+    if file is None:
+        raise HTTPException(status_code=404, detail="Audio not found")
+    tts_cache.touch(key)
+    return audio_response(request, file, key)
     
 if __name__ == "__main__":
     print(" Starting server on http://0.0.0.0:8001")
     print(" Android emulator can access via: http://10.0.2.2:8001")
     print(" Web browser can access via: http://localhost:8001")
     uvicorn.run(app, host="0.0.0.0", port=8001)
-
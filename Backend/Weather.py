@@ -1,14 +1,47 @@
+import asyncio
+import os
 import requests
+import httpx
 import pandas as pd
 from datetime import datetime
+from weather_cache import WeatherCache
+from climatology_store import ClimatologyStore
+from weather_providers import WeatherProvider, RecordingWeatherProvider, ReplayWeatherProvider
+
+OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY", "9f3841814a6ba2c0c7729fc1aefda6bc")
+
+IPINFO_URL = "https://ipinfo.io"
+OPENWEATHER_URL = "https://api.openweathermap.org/data/2.5/weather"
+NASA_POWER_URL = "https://power.larc.nasa.gov/api/temporal/climatology/point"
+
+# (connect, read) timeouts in seconds for the external APIs
+CONNECT_TIMEOUT = float(os.getenv("WEATHER_CONNECT_TIMEOUT", "3"))
+READ_TIMEOUT = float(os.getenv("WEATHER_READ_TIMEOUT", "10"))
+MAX_RETRIES = int(os.getenv("WEATHER_MAX_RETRIES", "2"))
+RETRY_BACKOFF = 0.5  # seconds, doubled after every failed attempt
+
+# Provider behind the async path: live, record (live + save to fixture) or replay (fixture only)
+WEATHER_PROVIDER = os.getenv("WEATHER_PROVIDER", "live")
+WEATHER_FIXTURE = os.getenv("WEATHER_FIXTURE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "weather_fixture.json"))
+WEATHER_REPLAY_LATENCY = float(os.getenv("WEATHER_REPLAY_LATENCY", "0"))
+WEATHER_REPLAY_JITTER = float(os.getenv("WEATHER_REPLAY_JITTER", "0"))
+WEATHER_REPLAY_FAILURE_RATE = float(os.getenv("WEATHER_REPLAY_FAILURE_RATE", "0"))
+WEATHER_REPLAY_SEED = os.getenv("WEATHER_REPLAY_SEED")
+
+# Location-keyed weather cache, see get_weather_cached
+WEATHER_CACHE_TTL = float(os.getenv("WEATHER_CACHE_TTL", "900"))
+WEATHER_CACHE_STALE_TTL = float(os.getenv("WEATHER_CACHE_STALE_TTL", "3600"))
+WEATHER_CACHE_SIZE = int(os.getenv("WEATHER_CACHE_SIZE", "1024"))
+WEATHER_CACHE_PRECISION = int(os.getenv("WEATHER_CACHE_PRECISION", "2"))
 
 def get_weather():
-    API_KEY = "9f3841814a6ba2c0c7729fc1aefda6bc" 
+    API_KEY = OPENWEATHER_API_KEY
+    timeout = (CONNECT_TIMEOUT, READ_TIMEOUT)
     print("Fetching location...")
 
     try:
         
-        ipinfo = requests.get("https://ipinfo.io").json()
+        ipinfo = requests.get(IPINFO_URL, timeout=timeout).json()
         loc = ipinfo["loc"].split(",")  # 'lat,long'
         latitude, longitude = float(loc[0]), float(loc[1])
         print(" Detected Location:", ipinfo.get("city"), ipinfo.get("region"), ipinfo.get("country"))
@@ -18,7 +51,7 @@ def get_weather():
 
     try:
         url = f"https://api.openweathermap.org/data/2.5/weather?lat={latitude}&lon={longitude}&units=metric&appid={API_KEY}"
-        response = requests.get(url).json()
+        response = requests.get(url, timeout=timeout).json()
 
         if "main" in response:
             city = response["name"]
@@ -36,31 +69,217 @@ def get_weather():
             return None
         
         print("\n Fetching Current Month Average Rainfall (NASA POWER)...")
-        nasa_url = (
-            f"https://power.larc.nasa.gov/api/temporal/climatology/point"
-            f"?parameters=PRECTOTCORR"
-            f"&community=AG"
-            f"&longitude={longitude}"
-            f"&latitude={latitude}"
-            f"&format=JSON"
-        )
-        nasa_response = requests.get(nasa_url).json()
+        rainfall_data = get_climatology_store().get(latitude, longitude)
+        if rainfall_data is None:
+            nasa_url = (
+                f"https://power.larc.nasa.gov/api/temporal/climatology/point"
+                f"?parameters=PRECTOTCORR"
+                f"&community=AG"
+                f"&longitude={longitude}"
+                f"&latitude={latitude}"
+                f"&format=JSON"
+            )
+            nasa_response = requests.get(nasa_url, timeout=timeout).json()
 
-        rainfall_data = nasa_response.get("properties", {}).get("parameter", {}).get("PRECTOTCORR", {})
+            rainfall_data = nasa_response.get("properties", {}).get("parameter", {}).get("PRECTOTCORR", {})
+            if rainfall_data:
+                get_climatology_store().put(latitude, longitude, rainfall_data)
         if not rainfall_data:
             print(" No rainfall data found")
             return None
 
-        month_abbr = datetime.now().strftime("%b").upper()[:3]
-        rainfall_value = rainfall_data.get(month_abbr)
+        monthly_rainfall = monthly_rainfall_from_climatology(rainfall_data)
+        
+        return latitude, longitude, temperature, weather_desc, city, humidity, monthly_rainfall
+
+    except Exception as e:
+        print("⚠ Error fetching data:", e)
+        return None
+
+
+def monthly_rainfall_from_climatology(rainfall_data, month_abbr=None):
+    """Converts the PRECTOTCORR mm/day climatology for a month into monthly rainfall in mm."""
+    month_abbr = month_abbr or datetime.now().strftime("%b").upper()[:3]
+    rainfall_value = rainfall_data.get(month_abbr)
+
+    if rainfall_value is None:
+        print(f" Rainfall data not found for {month_abbr}")
+        return None
+
+    monthly_rainfall = round(rainfall_value * 30, 2)
+    print(f" Average Rainfall in {month_abbr}: {monthly_rainfall} mm")
+    return monthly_rainfall
+
+
+# --- Async fetch path ---
+
+_http_client = None
+
+def get_http_client():
+    """Returns the shared keep-alive HTTP client, creating it on first use."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+        )
+    return _http_client
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+async def fetch_json(url, params=None):
+    """GETs a JSON document, retrying connection errors, timeouts, 429 and 5xx with backoff."""
+    delay = RETRY_BACKOFF
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = await get_http_client().get(url, params=params)
+            if response.status_code != 429 and response.status_code < 500:
+                return response.json()
+            error = httpx.HTTPStatusError(
+                f"{response.status_code} from {url}", request=response.request, response=response
+            )
+        except httpx.TransportError as e:
+            error = e
+
+        if attempt == MAX_RETRIES:
+            raise error
+        print(f" Retrying {url} in {delay}s after: {error}")
+        await asyncio.sleep(delay)
+        delay *= 2
+
+async def fetch_location():
+    """Returns (latitude, longitude) of the server from its IP address."""
+    ipinfo = await fetch_json(IPINFO_URL)
+    latitude, longitude = (float(x) for x in ipinfo["loc"].split(","))
+    print(" Detected Location:", ipinfo.get("city"), ipinfo.get("region"), ipinfo.get("country"))
+    return latitude, longitude
+
+async def fetch_current_weather(latitude, longitude):
+    """Returns (city, temperature, weather_desc, humidity) from OpenWeatherMap."""
+    response = await fetch_json(OPENWEATHER_URL, params={
+        "lat": latitude,
+        "lon": longitude,
+        "units": "metric",
+        "appid": OPENWEATHER_API_KEY,
+    })
+    if "main" not in response:
+        raise ValueError(f"OpenWeatherMap API error: {response}")
+    return (
+        response["name"],
+        response["main"]["temp"],
+        response["weather"][0]["description"],
+        response["main"]["humidity"],
+    )
+
+async def fetch_climatology(latitude, longitude):
+    """Returns the NASA POWER PRECTOTCORR monthly climatology (mm/day keyed by JAN..DEC, ANN)."""
+    nasa_response = await fetch_json(NASA_POWER_URL, params={
+        "parameters": "PRECTOTCORR",
+        "community": "AG",
+        "longitude": longitude,
+        "latitude": latitude,
+        "format": "JSON",
+    })
+    return nasa_response.get("properties", {}).get("parameter", {}).get("PRECTOTCORR", {})
+
+class LiveWeatherProvider(WeatherProvider):
+    """Provider backed by ipinfo, OpenWeatherMap and NASA POWER."""
 
-        if rainfall_value is not None:
-            monthly_rainfall = round(rainfall_value * 30, 2)
-            print(f" Average Rainfall in {month_abbr}: {monthly_rainfall} mm")
+    async def locate(self):
+        return await fetch_location()
+
+    async def current(self, latitude, longitude):
+        return await fetch_current_weather(latitude, longitude)
+
+    async def climatology(self, latitude, longitude):
+        return await fetch_climatology(latitude, longitude)
+
+_provider = None
+
+def get_provider():
+    """Returns the weather provider selected by WEATHER_PROVIDER, creating it on first use."""
+    global _provider
+    if _provider is None:
+        if WEATHER_PROVIDER == "live":
+            _provider = LiveWeatherProvider()
+        elif WEATHER_PROVIDER == "record":
+            _provider = RecordingWeatherProvider(LiveWeatherProvider(), WEATHER_FIXTURE)
+        elif WEATHER_PROVIDER == "replay":
+            _provider = ReplayWeatherProvider(
+                WEATHER_FIXTURE,
+                latency=WEATHER_REPLAY_LATENCY,
+                jitter=WEATHER_REPLAY_JITTER,
+                failure_rate=WEATHER_REPLAY_FAILURE_RATE,
+                seed=WEATHER_REPLAY_SEED,
+            )
         else:
-            print(f" Rainfall data not found for {month_abbr}")
-            monthly_rainfall = None
-        
+            raise ValueError(f"Unknown WEATHER_PROVIDER: {WEATHER_PROVIDER}")
+        print(f" Weather provider: {WEATHER_PROVIDER}")
+    return _provider
+
+def set_provider(provider):
+    """Replaces the weather provider, e.g. with a ReplayWeatherProvider in benchmarks."""
+    global _provider
+    _provider = provider
+
+_climatology_store = None
+
+def get_climatology_store():
+    """Returns the local climatology store, opening it on first use."""
+    global _climatology_store
+    if _climatology_store is None:
+        _climatology_store = ClimatologyStore()
+    return _climatology_store
+
+async def get_climatology(latitude, longitude):
+    """
+    Returns the PRECTOTCORR climatology for the location's cell, reading the
+    local store first and downloading (then storing) the cell only on a miss.
+    """
+    provider = get_provider()
+    if not provider.use_climatology_store:
+        return await provider.climatology(latitude, longitude)
+
+    store = get_climatology_store()
+    rainfall_data = await store.get_async(latitude, longitude)
+    if rainfall_data is not None:
+        return rainfall_data
+
+    rainfall_data = await provider.climatology(*store.cell_centre(latitude, longitude))
+    if rainfall_data:
+        await store.put_async(latitude, longitude, rainfall_data)
+    return rainfall_data
+
+async def get_weather_async(latitude=None, longitude=None):
+    """
+    Async counterpart of get_weather using the configured provider (the
+    pooled HTTP client for the live provider).
+
+    Locates the server by IP unless coordinates are given, then fetches the
+    current weather and the rainfall climatology concurrently. Returns the
+    same tuple as get_weather, or None on failure.
+    """
+    try:
+        if latitude is None or longitude is None:
+            latitude, longitude = await get_provider().locate()
+    except Exception as e:
+        print(" Error getting location:", e)
+        return None
+
+    try:
+        (city, temperature, weather_desc, humidity), rainfall_data = await asyncio.gather(
+            get_provider().current(latitude, longitude),
+            get_climatology(latitude, longitude),
+        )
+        if not rainfall_data:
+            print(" No rainfall data found")
+            return None
+
+        monthly_rainfall = monthly_rainfall_from_climatology(rainfall_data)
         return latitude, longitude, temperature, weather_desc, city, humidity, monthly_rainfall
 
     except Exception as e:
@@ -68,6 +287,37 @@ def get_weather():
         return None
 
 
+weather_cache = WeatherCache(
+    lambda latitude, longitude: get_weather_async(latitude, longitude),
+    ttl=WEATHER_CACHE_TTL,
+    stale_ttl=WEATHER_CACHE_STALE_TTL,
+    maxsize=WEATHER_CACHE_SIZE,
+    precision=WEATHER_CACHE_PRECISION,
+)
+
+# IP-derived server location, resolved once for requests without coordinates
+_server_location = None
+
+async def get_weather_cached(latitude=None, longitude=None):
+    """
+    Cached get_weather_async keyed on the rounded coordinates.
+
+    Returns the same tuple, with the coordinates of the cache cell, or None
+    if nothing could be fetched. Locates the server by IP unless coordinates
+    are given.
+    """
+    global _server_location
+    if latitude is None or longitude is None:
+        if _server_location is None:
+            try:
+                _server_location = await get_provider().locate()
+            except Exception as e:
+                print(" Error getting location:", e)
+                return None
+        latitude, longitude = _server_location
+    return await weather_cache.get(latitude, longitude)
+
+
 if __name__ == "__main__":
     result = get_weather()
     if result:
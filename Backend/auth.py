@@ -1,9 +1,9 @@
-from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-import firebase_admin
-from firebase_admin import credentials, auth, firestore
+from firebase_admin import firestore
 from datetime import datetime
+from firebase_auth import init_firebase, verify_token
 
 # Initialize FastAPI
 app = FastAPI(
@@ -20,10 +20,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize Firebase Admin
-if not firebase_admin._apps:
-    cred = credentials.Certificate("serviceAuth.json")  # path to service account key
-    firebase_admin.initialize_app(cred)
+# Initialize Firebase Admin (service account key from FIREBASE_CREDENTIALS, serviceAuth.json by default)
+init_firebase()
 
 db = firestore.client()
 
@@ -38,20 +36,6 @@ class SignUpRequest(BaseModel):
 class PingRequest(BaseModel):
     uid: str
 
-# ---------------------------
-# Helper: Verify ID Token
-# ---------------------------
-async def verify_token(request: Request):
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
-    token = auth_header.split("Bearer ")[1]
-    try:
-        decoded_token = auth.verify_id_token(token)
-        return decoded_token
-    except Exception as e:
-        raise HTTPException(status_code=401, detail="Invalid auth token: " + str(e))
-
 # ---------------------------
 # Routes
 # ---------------------------
@@ -0,0 +1,105 @@
+"""
+Correctness and throughput check of diagnosis_parser.parse_diagnosis against
+the corpus of Gemini diagnosis responses in diagnosis_corpus.json, with the
+previous regex parser of crop_diagnosis_chatbot for comparison.
+
+    python bench_diagnosis_parser.py --iterations 2000
+
+Exits with status 1 if any corpus entry is parsed differently than expected.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+from diagnosis_parser import LIST_SECTIONS, parse_diagnosis
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "diagnosis_corpus.json")
+
+
+def legacy_parse(text):
+    """The parse_disease_response implementation this parser replaced."""
+    parsed_data = {"disease_name": None, "causes": [], "symptoms": [], "solutions": [], "prevention": []}
+    disease_name_match = re.match(r"^\s*([A-Za-z0-9\s\$\$-]+(?: disease)?)\s*[:.]?\s*$", text.split('\n')[0])
+    if disease_name_match:
+        parsed_data["disease_name"] = disease_name_match.group(1).strip()
+    else:
+        first_sentence_match = re.match(r"^(.*?)\.", text)
+        if first_sentence_match:
+            parsed_data["disease_name"] = first_sentence_match.group(1).strip()
+    sections = re.split(r'\n\s*(?:Causes|Symptoms|Solutions|Prevention|Treatment|Recommendations|What to do|How to prevent):?\s*\n', text, flags=re.IGNORECASE)
+    general_description = sections[0].strip()
+    for i in range(1, len(sections)):
+        section_content = sections[i].strip()
+        if re.search(r'Causes:', text, re.IGNORECASE) and sections[i-1].endswith(re.search(r'Causes:', text, re.IGNORECASE).group()):
+            parsed_data["causes"] = [item.strip() for item in re.split(r'[\n*-]+', section_content) if item.strip()]
+        elif re.search(r'Symptoms:', text, re.IGNORECASE) and sections[i-1].endswith(re.search(r'Symptoms:', text, re.IGNORECASE).group()):
+            parsed_data["symptoms"] = [item.strip() for item in re.split(r'[\n*-]+', section_content) if item.strip()]
+        elif re.search(r'(Solutions|Treatment|Recommendations|What to do):', text, re.IGNORECASE) and sections[i-1].endswith(re.search(r'(Solutions|Treatment|Recommendations|What to do):', text, re.IGNORECASE).group()):
+            parsed_data["solutions"] = [item.strip() for item in re.split(r'[\n*-]+', section_content) if item.strip()]
+        elif re.search(r'(Prevention|How to prevent):', text, re.IGNORECASE) and sections[i-1].endswith(re.search(r'(Prevention|How to prevent):', text, re.IGNORECASE).group()):
+            parsed_data["prevention"] = [item.strip() for item in re.split(r'[\n*-]+', section_content) if item.strip()]
+    if not parsed_data["disease_name"] and general_description:
+        first_sentence_match = re.match(r"^(.*?)\.", general_description)
+        if first_sentence_match:
+            parsed_data["disease_name"] = first_sentence_match.group(1).strip()
+    parsed_data["response"] = text
+    return parsed_data
+
+
+def score(parse, corpus):
+    """Returns the number of entries parsed exactly as expected, and the first difference of each miss."""
+    correct = 0
+    misses = []
+    for entry in corpus:
+        parsed = parse(entry["response"])
+        for field in ("disease_name",) + LIST_SECTIONS:
+            if parsed[field] != entry["expected"][field]:
+                misses.append((entry["name"], field, parsed[field], entry["expected"][field]))
+                break
+        else:
+            correct += 1
+    return correct, misses
+
+
+def throughput(parse, texts, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for text in texts:
+            parse(text)
+    elapsed = time.perf_counter() - start
+    return iterations * len(texts) / elapsed, elapsed / (iterations * len(texts)) * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the diagnosis response parser.")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--iterations", type=int, default=1000)
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as file:
+        corpus = json.load(file)
+    texts = [entry["response"] for entry in corpus]
+
+    for name, parse in (("parse_diagnosis", parse_diagnosis), ("legacy", legacy_parse)):
+        correct, misses = score(parse, corpus)
+        rate, per_call = throughput(parse, texts, args.iterations)
+        print(f"{name}: {correct}/{len(corpus)} correct, {rate:.0f} responses/s ({per_call:.1f} us each)")
+        if name == "parse_diagnosis":
+            for entry, field, got, expected in misses:
+                print(f"  {entry}.{field}: got {got!r}, expected {expected!r}")
+            failed = bool(misses)
+
+    # Cost should grow linearly with response length
+    for copies in (1, 8, 64):
+        text = "\n\n".join(texts * copies)
+        timings = []
+        for parse in (parse_diagnosis, legacy_parse):
+            start = time.perf_counter()
+            parse(text)
+            timings.append((time.perf_counter() - start) * 1000)
+        print(f"{len(text):>8} chars: parse_diagnosis {timings[0]:.2f} ms, legacy {timings[1]:.2f} ms")
+
+    sys.exit(1 if failed else 0)
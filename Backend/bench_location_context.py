@@ -0,0 +1,61 @@
+"""
+Throughput and tail-latency benchmark of the location-context pipeline
+(weather cache -> weather provider -> crop ranking) used by /api/ask.
+
+Record a fixture once with network access:
+    WEATHER_PROVIDER=record python bench_location_context.py --requests 20
+then replay it offline:
+    WEATHER_PROVIDER=replay WEATHER_REPLAY_LATENCY=0.2 WEATHER_REPLAY_FAILURE_RATE=0.01 \
+        python bench_location_context.py --requests 5000 --concurrency 200
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import Weather
+from location_context import resolve_location_context
+
+
+async def run(requests, concurrency, locations, seed):
+    rng = random.Random(seed)
+    # Farm locations scattered around Punjab
+    points = [(rng.uniform(29.5, 32.5), rng.uniform(73.8, 77.0)) for _ in range(locations)]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async def one(i):
+        nonlocal failures
+        latitude, longitude = points[i % len(points)]
+        async with semaphore:
+            start = time.perf_counter()
+            context = await resolve_location_context(latitude, longitude)
+            latencies.append(time.perf_counter() - start)
+        if not context["crops"]:
+            failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    await Weather.close_http_client()
+
+    latencies.sort()
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000
+
+    print(f"provider={Weather.WEATHER_PROVIDER} requests={requests} concurrency={concurrency} locations={locations}")
+    print(f"throughput: {requests / elapsed:.1f} req/s, failures: {failures}")
+    print(f"latency ms: p50={pct(50):.2f} p90={pct(90):.2f} p99={pct(99):.2f} max={latencies[-1] * 1000:.2f}")
+    print(f"weather cache: {Weather.weather_cache.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the location-context pipeline.")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--locations", type=int, default=100, help="Distinct farm locations to cycle through")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    asyncio.run(run(args.requests, args.concurrency, args.locations, args.seed))
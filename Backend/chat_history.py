@@ -0,0 +1,131 @@
+import base64
+import json
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING, DESCENDING
+
+# Fields returned by the history API; the full Gemini prompt ("question") is left out
+HISTORY_PROJECTION = {"question": 0}
+
+# Newest first, with _id breaking ties between chats saved in the same millisecond
+HISTORY_SORT = [("created_at", DESCENDING), ("_id", DESCENDING)]
+# Oldest first, for exports
+EXPORT_SORT = [("created_at", ASCENDING), ("_id", ASCENDING)]
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Documents fetched per round trip while exporting
+EXPORT_BATCH_SIZE = 500
+
+
+async def ensure_indexes(collection):
+    """
+    Creates the indexes behind the history queries. Creating an index that
+    already exists is a no-op, so this is safe to run on every startup.
+    """
+    await collection.create_index(
+        [("session_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+        name="session_history",
+    )
+    await collection.create_index(
+        [("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+        name="user_history",
+        partialFilterExpression={"user_id": {"$type": "string"}},
+    )
+    # Serves exports without a session/user filter in EXPORT_SORT order, so they never sort in memory
+    await collection.create_index(EXPORT_SORT, name="created_at_id")
+    # Replaced by created_at_id, which covers the same created_at range queries
+    if "created_at" in await collection.index_information():
+        await collection.drop_index("created_at")
+
+
+def encode_cursor(doc):
+    """Opaque pagination cursor pointing just after `doc` in HISTORY_SORT order."""
+    raw = f"{doc['created_at'].isoformat()}|{doc['_id']}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Returns (created_at, _id) from encode_cursor(), raising ValueError if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        created_at, object_id = raw.split("|")
+        return datetime.fromisoformat(created_at), ObjectId(object_id)
+    except (ValueError, InvalidId, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def history_filter(session_id=None, user_id=None, since=None, until=None):
+    query = {}
+    if session_id:
+        query["session_id"] = session_id
+    if user_id:
+        query["user_id"] = user_id
+    if since or until:
+        query["created_at"] = {}
+        if since:
+            query["created_at"]["$gte"] = since
+        if until:
+            query["created_at"]["$lt"] = until
+    return query
+
+
+def serialize(doc):
+    """Makes a chat document JSON friendly."""
+    doc = dict(doc)
+    doc["id"] = str(doc.pop("_id"))
+    if isinstance(doc.get("created_at"), datetime):
+        doc["created_at"] = doc["created_at"].isoformat()
+    return doc
+
+
+async def fetch_page(collection, session_id=None, user_id=None, limit=DEFAULT_PAGE_SIZE, cursor=None):
+    """
+    Returns one page of a session's or user's chats, newest first.
+
+    Pages are keyset paginated on (created_at, _id): the cursor holds the
+    position of the last chat returned, so each page is an index range scan
+    no matter how deep the client has paged.
+
+    Parameters:
+        session_id, user_id: At least one is required
+        limit: Page size, capped at MAX_PAGE_SIZE
+        cursor: next_cursor of the previous page
+
+    Returns:
+        {"items": [...], "next_cursor": str or None}
+    """
+    if not session_id and not user_id:
+        raise ValueError("session_id or user_id is required")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    query = history_filter(session_id, user_id)
+    query["created_at"] = {"$type": "date"}
+    if cursor:
+        created_at, object_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": object_id}},
+        ]
+
+    # One extra document tells us whether there is a next page
+    docs = await collection.find(query, HISTORY_PROJECTION).sort(HISTORY_SORT).limit(limit + 1).to_list(limit + 1)
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return {"items": [serialize(doc) for doc in docs[:limit]], "next_cursor": next_cursor}
+
+
+async def export_ndjson(collection, session_id=None, user_id=None, since=None, until=None, include_prompt=False):
+    """
+    Yields matching chats as newline-delimited JSON, oldest first.
+
+    The Motor cursor is iterated batch by batch, so memory use stays flat
+    however many chats are exported.
+    """
+    projection = None if include_prompt else HISTORY_PROJECTION
+    cursor = collection.find(history_filter(session_id, user_id, since, until), projection)
+    cursor = cursor.sort(EXPORT_SORT).batch_size(EXPORT_BATCH_SIZE)
+    async for doc in cursor:
+        yield json.dumps(serialize(doc), ensure_ascii=False, default=str) + "\n"
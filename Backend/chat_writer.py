@@ -0,0 +1,102 @@
+import asyncio
+import time
+
+# Queued after the last record by stop()
+_STOP = object()
+
+
+class ChatLogWriter:
+    """
+    Write-behind batch writer for chat records.
+
+    Records are queued in memory (at most `max_queue`) and written with
+    insert_many once `batch_size` records are waiting or `flush_interval`
+    seconds have passed. When the queue is full, put() waits up to
+    `put_timeout` seconds for space and then drops the record, so a slow
+    database slows writers down without blocking requests indefinitely.
+    """
+
+    def __init__(self, get_collection, batch_size=100, flush_interval=1.0, max_queue=10000, put_timeout=0.5):
+        self.get_collection = get_collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.max_queue = max_queue
+        self._queue = None
+        self._task = None
+
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+
+    def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._task = asyncio.create_task(self._run())
+
+    async def put(self, record):
+        """Queues a record, returning False if it was dropped because the queue stayed full."""
+        if self._queue is None:
+            self.start()
+        try:
+            await asyncio.wait_for(self._queue.put(record), self.put_timeout)
+            return True
+        except asyncio.TimeoutError:
+            self.dropped += 1
+            if self.dropped % 100 == 1:
+                print(f"⚠ Chat log queue full, dropped record ({self.dropped} dropped so far)")
+            return False
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            record = await self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if record is _STOP:
+                    stopping = True
+                    break
+                batch.append(record)
+                timeout = deadline - time.monotonic()
+                if len(batch) >= self.batch_size or timeout <= 0:
+                    break
+                # asyncio.wait rather than wait_for, which can swallow a cancellation on 3.11
+                getter = asyncio.ensure_future(self._queue.get())
+                try:
+                    done, _ = await asyncio.wait({getter}, timeout=timeout)
+                finally:
+                    if not getter.done():
+                        getter.cancel()
+                if not done:
+                    break
+                record = getter.result()
+            if batch:
+                await self._write(batch)
+
+    async def _write(self, batch):
+        try:
+            await self.get_collection().insert_many(batch, ordered=False)
+            self.written += len(batch)
+            self.batches += 1
+        except Exception as e:
+            self.failed += len(batch)
+            print(f"⚠ MongoDB batch save of {len(batch)} records failed: {e}")
+
+    async def stop(self):
+        """Flushes everything still queued, then stops the background task."""
+        if self._task is None:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
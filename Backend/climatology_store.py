@@ -0,0 +1,174 @@
+"""
+Persistent store for the NASA POWER PRECTOTCORR monthly climatology.
+
+The climatology is effectively static, so the full 12-month vector is kept
+per grid cell in SQLite and looked up locally instead of being downloaded on
+every weather request.
+
+Fill the store ahead of time with:
+    python climatology_store.py prefetch --bbox 29.5,73.8,32.5,77.0
+    python climatology_store.py prefetch --points districts.csv
+where districts.csv has name,latitude,longitude rows.
+"""
+import argparse
+import asyncio
+import csv
+import math
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_DB_PATH = os.getenv(
+    "CLIMATOLOGY_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "climatology.sqlite3"),
+)
+
+# Degrees per cell, NASA POWER's solar/meteorology grid is 0.5° x 0.625°
+DEFAULT_CELL_SIZE = 0.5
+
+MONTHS = ("JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC")
+
+
+class ClimatologyStore:
+    """
+    Monthly climatology per grid cell in SQLite. get/put are for scripts and
+    sync code; async callers use get_async/put_async, which run the same
+    queries on the store's own thread instead of the event loop.
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH, cell_size=DEFAULT_CELL_SIZE):
+        self.path = path
+        self.cell_size = cell_size
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="climatology-sqlite")
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS climatology ("
+            " lat_cell INTEGER NOT NULL,"
+            " lon_cell INTEGER NOT NULL,"
+            + "".join(f" {month} REAL," for month in MONTHS)
+            + " ANN REAL,"
+            " fetched_at REAL NOT NULL,"
+            " PRIMARY KEY (lat_cell, lon_cell))"
+        )
+        self.conn.commit()
+
+    def cell(self, latitude, longitude):
+        return math.floor(latitude / self.cell_size), math.floor(longitude / self.cell_size)
+
+    def cell_centre(self, latitude, longitude):
+        lat_cell, lon_cell = self.cell(latitude, longitude)
+        return (lat_cell + 0.5) * self.cell_size, (lon_cell + 0.5) * self.cell_size
+
+    def get(self, latitude, longitude):
+        """Returns the climatology dict (JAN..DEC, ANN in mm/day) for the cell, or None."""
+        row = self.conn.execute(
+            f"SELECT {', '.join(MONTHS)}, ANN FROM climatology WHERE lat_cell = ? AND lon_cell = ?",
+            self.cell(latitude, longitude),
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(MONTHS + ("ANN",), row))
+
+    def contains(self, latitude, longitude):
+        return self.conn.execute(
+            "SELECT 1 FROM climatology WHERE lat_cell = ? AND lon_cell = ?",
+            self.cell(latitude, longitude),
+        ).fetchone() is not None
+
+    def put(self, latitude, longitude, rainfall_data):
+        values = [rainfall_data.get(month) for month in MONTHS + ("ANN",)]
+        self.conn.execute(
+            f"INSERT OR REPLACE INTO climatology (lat_cell, lon_cell, {', '.join(MONTHS)}, ANN, fetched_at)"
+            f" VALUES (?, ?, {', '.join('?' * len(values))}, ?)",
+            (*self.cell(latitude, longitude), *values, time.time()),
+        )
+        self.conn.commit()
+
+    async def _run(self, method, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, method, *args)
+
+    async def get_async(self, latitude, longitude):
+        return await self._run(self.get, latitude, longitude)
+
+    async def put_async(self, latitude, longitude, rainfall_data):
+        await self._run(self.put, latitude, longitude, rainfall_data)
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM climatology").fetchone()[0]
+
+    def close(self):
+        self._executor.shutdown()
+        self.conn.close()
+
+    def cells_in_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """Yields the centre of every cell overlapping the bounding box."""
+        lat_lo, lon_lo = self.cell(min_lat, min_lon)
+        lat_hi, lon_hi = self.cell(max_lat, max_lon)
+        for lat_cell in range(lat_lo, lat_hi + 1):
+            for lon_cell in range(lon_lo, lon_hi + 1):
+                yield (lat_cell + 0.5) * self.cell_size, (lon_cell + 0.5) * self.cell_size
+
+
+async def prefetch(store, points, concurrency=4, refresh=False):
+    """Downloads and stores the climatology of every point's cell, skipping stored cells."""
+    from Weather import fetch_climatology, close_http_client
+
+    cells = {}
+    for latitude, longitude in points:
+        key = store.cell(latitude, longitude)
+        if key not in cells and (refresh or not store.contains(latitude, longitude)):
+            cells[key] = store.cell_centre(latitude, longitude)
+
+    print(f"Prefetching {len(cells)} cells with concurrency {concurrency}")
+    semaphore = asyncio.Semaphore(concurrency)
+    failed = 0
+
+    async def fetch_cell(latitude, longitude):
+        nonlocal failed
+        async with semaphore:
+            try:
+                rainfall_data = await fetch_climatology(latitude, longitude)
+            except Exception as e:
+                rainfall_data = None
+                print(f" Failed {latitude},{longitude}: {e}")
+        if rainfall_data:
+            await store.put_async(latitude, longitude, rainfall_data)
+        else:
+            failed += 1
+
+    await asyncio.gather(*(fetch_cell(lat, lon) for lat, lon in cells.values()))
+    await close_http_client()
+    print(f"Stored {len(cells) - failed} cells, {failed} failed, {len(store)} cells total")
+
+
+def _read_points(path):
+    with open(path, newline="") as file:
+        for row in csv.reader(file):
+            if len(row) < 3 or row[0].strip().lower() == "name":
+                continue
+            yield float(row[1]), float(row[2])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the local NASA POWER climatology store.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    prefetch_parser = subparsers.add_parser("prefetch", help="Bulk-download climatology into the store")
+    area = prefetch_parser.add_mutually_exclusive_group(required=True)
+    area.add_argument("--bbox", help="min_lat,min_lon,max_lat,max_lon")
+    area.add_argument("--points", help="CSV file with name,latitude,longitude rows")
+    prefetch_parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    prefetch_parser.add_argument("--cell-size", type=float, default=DEFAULT_CELL_SIZE)
+    prefetch_parser.add_argument("--concurrency", type=int, default=4)
+    prefetch_parser.add_argument("--refresh", action="store_true", help="Re-download cells already stored")
+    args = parser.parse_args()
+
+    store = ClimatologyStore(args.db, cell_size=args.cell_size)
+    if args.bbox:
+        points = list(store.cells_in_bbox(*(float(x) for x in args.bbox.split(","))))
+    else:
+        points = list(_read_points(args.points))
+
+    asyncio.run(prefetch(store, points, concurrency=args.concurrency, refresh=args.refresh))
+    store.close()
@@ -0,0 +1,93 @@
+"""
+Token-budgeted context for multi-turn Gemini conversations.
+
+Past turns are sent as native chat history instead of being pasted into every
+prompt. The history sent stays within a token budget: once a session's history
+grows past it, the oldest turns are folded into a running summary that is kept
+on the session and sent as part of the compact context with each new turn.
+"""
+
+# Rough token count used for budgeting; Gemini averages about 4 characters per token
+CHARS_PER_TOKEN = 4
+
+# Keys of the disease context that are not worth repeating to the model
+_SKIPPED_CONTEXT_KEYS = {"response"}
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def turn_tokens(turn):
+    return estimate_tokens(turn["text"])
+
+
+def recent_turns(history, budget):
+    """Returns the newest turns whose combined size fits within `budget` tokens."""
+    used = 0
+    start = len(history)
+    while start > 0:
+        used += turn_tokens(history[start - 1])
+        if used > budget:
+            break
+        start -= 1
+    # Gemini expects the history to start with a user turn
+    while start < len(history) and history[start]["sender"] != "user":
+        start += 1
+    return history[start:]
+
+
+def to_gemini_history(turns):
+    return [
+        {"role": "user" if turn["sender"] == "user" else "model", "parts": [turn["text"]]}
+        for turn in turns
+    ]
+
+
+def turns_to_summarize(history, budget):
+    """
+    Returns how many of the oldest turns to fold into the summary, or 0 while
+    the history fits in `budget`. Enough turns are folded to bring the rest
+    down to half the budget, so summaries are not regenerated every turn.
+    """
+    total = sum(turn_tokens(turn) for turn in history)
+    if total <= budget:
+        return 0
+    count = 0
+    for turn in history:
+        if total <= budget // 2:
+            break
+        total -= turn_tokens(turn)
+        count += 1
+    # Keep user/bot pairs together so the remaining history starts with a user turn
+    while count < len(history) and history[count]["sender"] != "user":
+        count += 1
+    return count
+
+
+def compact_context(disease_context, summary=None):
+    """One line per known fact about the diagnosis, plus the running summary."""
+    lines = []
+    for key, value in (disease_context or {}).items():
+        if not value or key in _SKIPPED_CONTEXT_KEYS:
+            continue
+        if isinstance(value, list):
+            value = "; ".join(str(item) for item in value)
+        lines.append(f"{key.replace('_', ' ').title()}: {value}")
+    if summary:
+        lines.append(f"Earlier conversation: {summary}")
+    return "\n".join(lines)
+
+
+def summary_prompt(previous_summary, turns):
+    parts = [
+        "Summarize this conversation between a farmer and an agricultural assistant in at most "
+        "5 short sentences. Keep the crop, the diagnosis, treatments discussed, quantities and "
+        "any open questions. Reply with the summary only."
+    ]
+    if previous_summary:
+        parts.append(f"\nSummary so far: {previous_summary}")
+    parts.append("\nConversation:")
+    for turn in turns:
+        parts.append(f"{turn['sender'].capitalize()}: {turn['text']}")
+    return "\n".join(parts)
@@ -2,12 +2,19 @@
 import os
 import asyncio
 import json
-import re
+from contextlib import asynccontextmanager
 from typing import Dict, List, Any, Optional
 import google.generativeai as genai
-from fastapi import FastAPI, HTTPException, status
+from fastapi import FastAPI, HTTPException, Response, status
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
+from llm_cache import prompt_key
+from singleflight import SingleFlight
+from session_store import create_session_store
+from diagnosis_parser import LIST_SECTIONS, DiagnosisStreamParser, parse_diagnosis, parse_diagnosis_json, response_schema
+from conversation import compact_context, recent_turns, summary_prompt, to_gemini_history, turns_to_summarize
+from disease_kb import DiseaseKnowledgeBase, language_name
 
 # Load environment variables
 from dotenv import load_dotenv
@@ -33,15 +40,45 @@ safety_settings = [
     {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
     {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
 ]
+GEMINI_MODEL = "gemini-1.5-flash"
 model = genai.GenerativeModel(
-    model_name="gemini-1.5-flash",
+    model_name=GEMINI_MODEL,
     generation_config=generation_config,
     safety_settings=safety_settings,
 )
 
-# In-memory storage for conversations (for development purposes)
-# In a production environment, replace this with a proper database (e.g., Redis, PostgreSQL)
-conversations: Dict[str, Dict[str, Any]] = {}
+# Conversations idle for SESSION_TTL seconds expire, at most MAX_SESSIONS are kept (least
+# recently used dropped first) and each keeps its last MAX_HISTORY_TURNS messages
+SESSION_TTL = float(os.getenv("SESSION_TTL", "3600"))
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "10000"))
+MAX_HISTORY_TURNS = int(os.getenv("MAX_HISTORY_TURNS", "50"))
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))
+# Ask Gemini for JSON matching DiagnosisResponse instead of free text, unless a request says otherwise
+STRUCTURED_DIAGNOSIS = os.getenv("STRUCTURED_DIAGNOSIS", "false").lower() == "true"
+# Estimated tokens of past turns sent with each message; older turns are folded into a summary
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+# Set to a header name (e.g. X-Session-Id) to echo the session id on every response, so a
+# load balancer can pin a conversation to one node when SESSION_BACKEND=memory
+SESSION_HINT_HEADER = os.getenv("SESSION_HINT_HEADER")
+# Image predictions at least this confident are answered from the disease knowledge base
+# (built with `python disease_kb.py build`) instead of asking Gemini
+KB_MIN_CONFIDENCE = float(os.getenv("KB_MIN_CONFIDENCE", "0.8"))
+
+# SESSION_BACKEND picks where conversations live: memory (one worker), sqlite (workers on one
+# host, SESSION_DB) or redis (any number of nodes, REDIS_URL)
+conversations = create_session_store(
+    ttl=SESSION_TTL,
+    max_sessions=MAX_SESSIONS,
+    max_history=MAX_HISTORY_TURNS,
+    sweep_interval=SESSION_SWEEP_INTERVAL,
+)
+
+# Concurrent requests with the same prompt share one Gemini call
+gemini_flight = SingleFlight()
+# Sessions whose history is being summarized, so each is summarized once at a time
+summarizing: Dict[str, asyncio.Task] = {}
+# Precomputed advice per disease class and language
+disease_kb = DiseaseKnowledgeBase.load()
 
 # --- Pydantic Models ---
 class DiagnosisRequest(BaseModel):
@@ -57,6 +94,8 @@ class DiagnosisRequest(BaseModel):
     confidence: Optional[float] = None
     top_predictions: Optional[List[Dict[str, Any]]] = None
     model_validation: Optional[Dict[str, Any]] = None
+    structured: Optional[bool] = None  # JSON output mode, defaults to STRUCTURED_DIAGNOSIS
+    language: Optional[str] = None  # Reply language code (en, hi, pa), defaults to English
 
 class ChatRequest(BaseModel):
     message: str
@@ -79,11 +118,25 @@ class ChatResponse(BaseModel):
     response: str
     session_id: str
 
+# Generation settings of the JSON output mode; "response" holds a short prose summary
+DIAGNOSIS_JSON_CONFIG = genai.GenerationConfig(
+    response_mime_type="application/json",
+    response_schema=response_schema(DiagnosisResponse, exclude=("confidence", "session_id")),
+)
+
 # --- FastAPI App Setup ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Periodically drop expired conversations
+    conversations.start()
+    yield
+    await conversations.stop()
+
 app = FastAPI(
     title="Crop Diagnosis Chatbot",
     description="AI-powered chatbot for crop disease diagnosis and farming advice.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -104,67 +157,24 @@ def extract_crop_type_from_disease(disease_class: str) -> str:
 
 def parse_disease_response(text: str) -> Dict[str, Any]:
     """Parses the AI's response into structured sections."""
-    parsed_data = {
-        "disease_name": None,
-        "causes": [],
-        "symptoms": [],
-        "solutions": [],
-        "prevention": []
-    }
-
-    # Extract disease name (often the first line or bolded)
-    disease_name_match = re.match(r"^\s*([A-Za-z0-9\s\$\$-]+(?: disease)?)\s*[:.]?\s*$", text.split('\n')[0])
-    if disease_name_match:
-        parsed_data["disease_name"] = disease_name_match.group(1).strip()
-    else:
-        # Fallback: try to find a common disease name pattern
-        first_sentence_match = re.match(r"^(.*?)\.", text)
-        if first_sentence_match:
-            parsed_data["disease_name"] = first_sentence_match.group(1).strip()
-        
-    sections = re.split(r'\n\s*(?:Causes|Symptoms|Solutions|Prevention|Treatment|Recommendations|What to do|How to prevent):?\s*\n', text, flags=re.IGNORECASE)
-    
-    # The first part is usually the general description
-    general_description = sections[0].strip()
-    
-    # Iterate through the rest of the sections
-    for i in range(1, len(sections)):
-        section_content = sections[i].strip()
-        
-        # Determine which section it is based on the preceding keyword
-        # This is a bit tricky with re.split, so we'll re-match the keywords
-        if re.search(r'Causes:', text, re.IGNORECASE) and sections[i-1].endswith(re.search(r'Causes:', text, re.IGNORECASE).group()):
-            parsed_data["causes"] = [item.strip() for item in re.split(r'[\n*-]+', section_content) if item.strip()]
-        elif re.search(r'Symptoms:', text, re.IGNORECASE) and sections[i-1].endswith(re.search(r'Symptoms:', text, re.IGNORECASE).group()):
-            parsed_data["symptoms"] = [item.strip() for item in re.split(r'[\n*-]+', section_content) if item.strip()]
-        elif re.search(r'(Solutions|Treatment|Recommendations|What to do):', text, re.IGNORECASE) and sections[i-1].endswith(re.search(r'(Solutions|Treatment|Recommendations|What to do):', text, re.IGNORECASE).group()):
-            parsed_data["solutions"] = [item.strip() for item in re.split(r'[\n*-]+', section_content) if item.strip()]
-        elif re.search(r'(Prevention|How to prevent):', text, re.IGNORECASE) and sections[i-1].endswith(re.search(r'(Prevention|How to prevent):', text, re.IGNORECASE).group()):
-            parsed_data["prevention"] = [item.strip() for item in re.split(r'[\n*-]+', section_content) if item.strip()]
-
-    # If disease_name wasn't extracted from the first line, try to get it from the general description
-    if not parsed_data["disease_name"] and general_description:
-        first_sentence_match = re.match(r"^(.*?)\.", general_description)
-        if first_sentence_match:
-            parsed_data["disease_name"] = first_sentence_match.group(1).strip()
-
-    # Ensure lists are not empty if no specific items were found, but general description exists
-    if not parsed_data["causes"] and "causes" in general_description.lower():
-        pass # Could add more sophisticated parsing here
-    
-    # The full response text is the primary 'response'
-    parsed_data["response"] = text
-    
-    return parsed_data
+    return parse_diagnosis(text)
 
-def create_disease_diagnosis_prompt(request: DiagnosisRequest, conversation_history: List[Dict[str, str]]) -> str:
+def create_disease_diagnosis_prompt(request: DiagnosisRequest, conversation_history: List[Dict[str, str]], structured: bool = False) -> str:
     """Creates a detailed prompt for initial disease diagnosis, incorporating ML model predictions."""
-    prompt_parts = [
-        "You are an expert agricultural AI assistant specializing in crop disease diagnosis and management. "
-        "Provide a comprehensive diagnosis and actionable advice. "
-        "Structure your response clearly with sections for Disease Name, Causes, Symptoms, Solutions (Treatment/Recommendations), and Prevention. "
-        "Use bullet points for lists within sections. Be concise but informative."
-    ]
+    if structured:
+        # The response schema carries the structure, so no formatting instructions are needed
+        prompt_parts = [
+            "You are an expert agricultural AI assistant specializing in crop disease diagnosis and management. "
+            "Provide a diagnosis and actionable advice as JSON. "
+            "Put a 2-3 sentence summary in 'response' and keep each list item to one short sentence."
+        ]
+    else:
+        prompt_parts = [
+            "You are an expert agricultural AI assistant specializing in crop disease diagnosis and management. "
+            "Provide a comprehensive diagnosis and actionable advice. "
+            "Structure your response clearly with sections for Disease Name, Causes, Symptoms, Solutions (Treatment/Recommendations), and Prevention. "
+            "Use bullet points for lists within sections. Be concise but informative."
+        ]
 
     # Safely access top_predictions
     top_preds = request.top_predictions or []
@@ -190,65 +200,61 @@ def create_disease_diagnosis_prompt(request: DiagnosisRequest, conversation_hist
     if request.crop_type:
         prompt_parts.append(f"The crop type is: {request.crop_type}.")
     
+    if request.language:
+        prompt_parts.append(f"Respond in {language_name(request.language)}.")
+
     if request.follow_up_question:
         prompt_parts.append(f"\nAdditionally, the user has a specific question: '{request.follow_up_question}'. Address this within your comprehensive response.")
 
     prompt_parts.append("\nProvide the diagnosis and advice now:")
     return "\n".join(prompt_parts)
 
-def create_followup_prompt(request: DiagnosisRequest, conversation_history: List[Dict[str, str]], disease_context: Dict[str, Any]) -> str:
-    """Creates a prompt for follow-up questions, maintaining context."""
+def create_followup_prompt(request: DiagnosisRequest, disease_context: Dict[str, Any], summary: Optional[str] = None) -> str:
+    """Creates the message for a follow-up question; earlier turns are sent as chat history."""
     prompt_parts = [
-        "You are an expert agricultural AI assistant. The user is asking a follow-up question about a previously diagnosed crop disease. "
-        "Maintain context from the previous diagnosis and conversation. "
+        "You are an expert agricultural AI assistant. The user is asking a follow-up question about a previously diagnosed crop disease."
     ]
-    if disease_context:
-        prompt_parts.append(f"\n**Current Disease Context:**")
-        for key, value in disease_context.items():
-            if value and key != "response": # Don't repeat the full response text
-                if isinstance(value, list):
-                    prompt_parts.append(f"- {key.replace('_', ' ').title()}: {', '.join(value)}")
-                else:
-                    prompt_parts.append(f"- {key.replace('_', ' ').title()}: {value}")
-    
-    prompt_parts.append("\n**Conversation History (most recent first):**")
-    # Include last few turns for context
-    for msg in conversation_history[-4:]: # Last 4 messages
-        prompt_parts.append(f"{msg['sender'].capitalize()}: {msg['text']}")
+    context = compact_context(disease_context, summary)
+    if context:
+        prompt_parts.append(f"\n**Current Disease Context:**\n{context}")
 
     prompt_parts.append(f"\n**User's Follow-up Question:** {request.follow_up_question}")
+    if request.language:
+        prompt_parts.append(f"Respond in {language_name(request.language)}.")
     prompt_parts.append("\nProvide a helpful and concise answer based on the context:")
     return "\n".join(prompt_parts)
 
-def create_chat_prompt(message: str, conversation_history: List[Dict[str, str]], disease_context: Dict[str, Any]) -> str:
-    """Creates a prompt for general chat, maintaining context."""
+def create_chat_prompt(message: str, disease_context: Dict[str, Any], summary: Optional[str] = None) -> str:
+    """Creates the message for a chat turn; earlier turns are sent as chat history."""
     prompt_parts = [
-        "You are an expert agricultural AI assistant. Engage in a helpful conversation about crop diseases or general farming. "
-        "Maintain context from previous interactions."
+        "You are an expert agricultural AI assistant. Engage in a helpful conversation about crop diseases or general farming."
     ]
-    if disease_context:
-        prompt_parts.append(f"\n**Current Disease Context:**")
-        for key, value in disease_context.items():
-            if value and key != "response":
-                if isinstance(value, list):
-                    prompt_parts.append(f"- {key.replace('_', ' ').title()}: {', '.join(value)}")
-                else:
-                    prompt_parts.append(f"- {key.replace('_', ' ').title()}: {value}")
-    
-    prompt_parts.append("\n**Conversation History (most recent first):")
-    for msg in conversation_history[-6:]: # Last 6 messages
-        prompt_parts.append(f"{msg['sender'].capitalize()}: {msg['text']}")
+    context = compact_context(disease_context, summary)
+    if context:
+        prompt_parts.append(f"\n**Current Disease Context:**\n{context}")
 
     prompt_parts.append(f"\n**User's Message:** {message}")
     prompt_parts.append("\nProvide a helpful and concise answer:")
     return "\n".join(prompt_parts)
 
-async def get_gemini_response(prompt: str) -> str:
-    """Sends a prompt to the Gemini model and returns the response."""
-    try:
-        chat_session = model.start_chat(history=[])
-        response = await chat_session.send_message_async(prompt)
+async def get_gemini_response(prompt: str, history: Optional[List[Dict[str, str]]] = None, json_mode: bool = False) -> str:
+    """
+    Sends a prompt to the Gemini model, after the given earlier turns, and returns the response.
+    With json_mode the reply is JSON following DIAGNOSIS_JSON_CONFIG's schema.
+    """
+    gemini_history = to_gemini_history(history or [])
+
+    async def send():
+        chat_session = model.start_chat(history=gemini_history)
+        if json_mode:
+            response = await chat_session.send_message_async(prompt, generation_config=DIAGNOSIS_JSON_CONFIG)
+        else:
+            response = await chat_session.send_message_async(prompt)
         return response.text
+
+    try:
+        key = prompt_key(GEMINI_MODEL, f"{json_mode}" + json.dumps(gemini_history) + prompt)
+        return await gemini_flight.do(key, send)
     except Exception as e:
         print(f"Error getting Gemini response: {e}")
         raise HTTPException(
@@ -256,20 +262,37 @@ async def get_gemini_response(prompt: str) -> str:
             detail=f"Failed to get response from AI model: {e}"
         )
 
-async def diagnose_crop(request: DiagnosisRequest) -> DiagnosisResponse:
-    """Handles the core diagnosis logic, generating a session if needed."""
-    session_id = request.session_id or f"session_{os.urandom(16).hex()}"
-
-    if session_id not in conversations:
-        conversations[session_id] = {
-            "history": [],
-            "disease_context": {}
-        }
-
-    history = conversations[session_id]["history"]
-    disease_context = conversations[session_id]["disease_context"]
-
-    # Add user's initial input to history
+async def summarize_history(session_id: str, turns: List[Dict[str, str]], summary: Optional[str]):
+    """Folds the oldest turns of a session into its running summary."""
+    try:
+        new_summary = await get_gemini_response(summary_prompt(summary, turns))
+        if await conversations.fold_history(session_id, turns, new_summary.strip()):
+            print(f" Summarized {len(turns)} turns of {session_id}")
+        else:
+            print(f" Skipped summary of {session_id}, its history changed meanwhile")
+    except Exception as e:
+        print(f"⚠ Summarizing {session_id} failed: {e}")
+
+def maybe_summarize(session_id: str, history: List[Dict[str, str]], summary: Optional[str]):
+    """Starts summarizing in the background once the history outgrows the context budget."""
+    # The store keeps only the last max_history turns, so the oldest ones here may already be gone
+    history = history[-conversations.max_history:]
+    count = turns_to_summarize(history, CONTEXT_TOKEN_BUDGET)
+    if count and session_id not in summarizing:
+        task = asyncio.create_task(summarize_history(session_id, history[:count], summary))
+        summarizing[session_id] = task
+        task.add_done_callback(lambda _: summarizing.pop(session_id, None))
+
+async def get_gemini_stream(prompt: str, history: Optional[List[Dict[str, str]]] = None):
+    """Yields the text of a Gemini reply, after the given earlier turns, as it is generated."""
+    chat_session = model.start_chat(history=to_gemini_history(history or []))
+    response = await chat_session.send_message_async(prompt, stream=True)
+    async for chunk in response:
+        if chunk.text:
+            yield chunk.text
+
+def diagnosis_user_text(request: DiagnosisRequest) -> str:
+    """The user's side of a diagnosis turn, as kept in the session history."""
     user_input_text = ""
     if request.predicted_class:
         user_input_text = f"Image analysis suggests: {request.predicted_class} (Confidence: {request.confidence:.2f})."
@@ -282,32 +305,34 @@ async def diagnose_crop(request: DiagnosisRequest) -> DiagnosisResponse:
     
     if request.follow_up_question:
         user_input_text += f" My question is: {request.follow_up_question}"
-
+    return user_input_text
+
+def knowledge_base_answer(request: DiagnosisRequest) -> Optional[Dict[str, Any]]:
+    """The precomputed advice for a confident image prediction without a question, if any."""
+    if (request.predicted_class and not request.follow_up_question
+            and (request.confidence or 0) >= KB_MIN_CONFIDENCE):
+        return disease_kb.get(request.predicted_class, request.language)
+    return None
+
+async def finish_diagnosis(request: DiagnosisRequest, session_id: str, session: Dict[str, Any],
+                           ai_response_text: str, parsed_data: Dict[str, Any]) -> DiagnosisResponse:
+    """Records the turn and its disease context on the session in one update, and builds the response."""
+    new_turns = []
+    user_input_text = diagnosis_user_text(request)
     if user_input_text:
-        history.append({"sender": "user", "text": user_input_text})
+        new_turns.append({"sender": "user", "text": user_input_text})
+    new_turns.append({"sender": "bot", "text": ai_response_text})
 
-    if request.follow_up_question and disease_context:
-        prompt = create_followup_prompt(request, history, disease_context)
-    else:
-        prompt = create_disease_diagnosis_prompt(request, history)
-
-    ai_response_text = await get_gemini_response(prompt)
-    
-    # Parse the AI's response into structured data
-    parsed_data = parse_disease_response(ai_response_text)
-    
-    # Update disease context for future follow-ups
-    conversations[session_id]["disease_context"].update({
+    # Update disease context for future follow-ups, together with the history
+    await conversations.record_turn(session_id, {
         "disease_name": parsed_data.get("disease_name"),
         "causes": parsed_data.get("causes"),
         "symptoms": parsed_data.get("symptoms"),
         "solutions": parsed_data.get("solutions"),
         "prevention": parsed_data.get("prevention"),
         "confidence": request.confidence # Store confidence from ML model
-    })
-
-    # Add AI's response to history
-    history.append({"sender": "bot", "text": ai_response_text})
+    }, *new_turns)
+    maybe_summarize(session_id, session["history"] + new_turns, session["summary"])
 
     return DiagnosisResponse(
         response=ai_response_text,
@@ -320,6 +345,127 @@ async def diagnose_crop(request: DiagnosisRequest) -> DiagnosisResponse:
         session_id=session_id
     )
 
+async def load_session(session_id: str) -> Dict[str, Any]:
+    return await conversations.get(session_id) or {"history": [], "disease_context": {}, "summary": None}
+
+async def diagnose_crop(request: DiagnosisRequest) -> DiagnosisResponse:
+    """Handles the core diagnosis logic, generating a session if needed."""
+    session_id = await conversations.create(request.session_id)
+    session = await load_session(session_id)
+
+    # A confident image prediction without a question gets the precomputed advice for its class
+    parsed_data = knowledge_base_answer(request)
+    if parsed_data is not None:
+        return await finish_diagnosis(request, session_id, session, parsed_data["response"], parsed_data)
+
+    structured = STRUCTURED_DIAGNOSIS if request.structured is None else request.structured
+    if request.follow_up_question and session["disease_context"]:
+        # Follow-up answers are prose, so they are never requested as JSON
+        structured = False
+        prompt = create_followup_prompt(request, session["disease_context"], session["summary"])
+        context_turns = recent_turns(session["history"], CONTEXT_TOKEN_BUDGET)
+    else:
+        prompt = create_disease_diagnosis_prompt(request, session["history"], structured)
+        context_turns = []
+
+    ai_response_text = await get_gemini_response(prompt, context_turns, json_mode=structured)
+    
+    # Parse the AI's response into structured data
+    if structured:
+        try:
+            parsed_data = DiagnosisResponse.model_validate(
+                {**parse_diagnosis_json(ai_response_text), "session_id": session_id}
+            ).model_dump()
+            ai_response_text = parsed_data["response"]
+        except ValueError as e:
+            # Truncated or malformed JSON is never shown to the user, the diagnosis is asked again as prose
+            print(f"⚠ Structured diagnosis did not match the schema, retrying as text: {e}")
+            prompt = create_disease_diagnosis_prompt(request, session["history"], structured=False)
+            ai_response_text = await get_gemini_response(prompt, context_turns)
+    if parsed_data is None:
+        parsed_data = parse_disease_response(ai_response_text)
+
+    return await finish_diagnosis(request, session_id, session, ai_response_text, parsed_data)
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def entry_events(parsed_data: Dict[str, Any]) -> List[tuple]:
+    """The stream parser's events for an already complete diagnosis."""
+    events = []
+    if parsed_data.get("disease_name"):
+        events.append(("disease_name", {"disease_name": parsed_data["disease_name"]}))
+    for section in LIST_SECTIONS:
+        if parsed_data.get(section):
+            events.append(("section_start", {"section": section}))
+            events.extend(("item", {"section": section, "text": item}) for item in parsed_data[section])
+    return events
+
+async def stream_diagnosis(request: DiagnosisRequest, session_id: str):
+    """
+    Yields a diagnosis as SSE events: "chunk" for each piece of text as Gemini
+    generates it, "disease_name", "section_start" and "item" as the stream
+    parser finds them, then "done" with the DiagnosisResponse once the turn is
+    recorded on the session. Nothing is recorded if the stream fails.
+    """
+    session = await load_session(session_id)
+
+    parsed_data = knowledge_base_answer(request)
+    if parsed_data is not None:
+        yield sse_event("chunk", {"text": parsed_data["response"]})
+        for event, data in entry_events(parsed_data):
+            yield sse_event(event, data)
+        result = await finish_diagnosis(request, session_id, session, parsed_data["response"], parsed_data)
+        yield sse_event("done", result.model_dump())
+        return
+
+    # Streams are always prose, since sections of a JSON reply cannot be read before it is complete
+    if request.follow_up_question and session["disease_context"]:
+        prompt = create_followup_prompt(request, session["disease_context"], session["summary"])
+        context_turns = recent_turns(session["history"], CONTEXT_TOKEN_BUDGET)
+    else:
+        prompt = create_disease_diagnosis_prompt(request, session["history"])
+        context_turns = []
+
+    parser = DiagnosisStreamParser()
+    try:
+        async for text in get_gemini_stream(prompt, context_turns):
+            yield sse_event("chunk", {"text": text})
+            for event, data in parser.feed(text):
+                yield sse_event(event, data)
+    except Exception as e:
+        print(f"Error streaming Gemini response: {e}")
+        yield sse_event("error", {"error": f"Failed to get response from AI model: {e}"})
+        return
+    for event, data in parser.close():
+        yield sse_event(event, data)
+
+    result = await finish_diagnosis(request, session_id, session, parser.parsed["response"], parser.parsed)
+    yield sse_event("done", result.model_dump())
+
+async def stream_chat(request: ChatRequest, session: Dict[str, Any]):
+    """Yields a chat reply as SSE "chunk" events, then "done" once the exchange is recorded."""
+    prompt = create_chat_prompt(request.message, session["disease_context"], session["summary"])
+    chunks = []
+    try:
+        async for text in get_gemini_stream(prompt, recent_turns(session["history"], CONTEXT_TOKEN_BUDGET)):
+            chunks.append(text)
+            yield sse_event("chunk", {"text": text})
+    except Exception as e:
+        print(f"Error streaming Gemini response: {e}")
+        yield sse_event("error", {"error": f"Failed to get response from AI model: {e}"})
+        return
+
+    ai_response_text = "".join(chunks)
+    new_turns = [{"sender": "user", "text": request.message}, {"sender": "bot", "text": ai_response_text}]
+    await conversations.append_history(request.session_id, *new_turns)
+    maybe_summarize(request.session_id, session["history"] + new_turns, session["summary"])
+    yield sse_event("done", {"response": ai_response_text, "session_id": request.session_id})
+
+def add_session_hint(response: Response, session_id: str):
+    if SESSION_HINT_HEADER:
+        response.headers[SESSION_HINT_HEADER] = session_id
+
 # --- API Endpoints ---
 
 @app.get("/")
@@ -334,47 +480,86 @@ async def test_endpoint():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Gemini API test failed: {e}")
 
+@app.get("/api/metrics")
+async def metrics():
+    return {
+        "gemini_singleflight": gemini_flight.metrics(),
+        "sessions": await conversations.stats(),
+        "disease_kb": disease_kb.stats(),
+    }
+
 @app.post("/api/start_session", response_model=SessionRequest)
-async def start_session(request: SessionRequest):
-    session_id = request.session_id or f"session_{os.urandom(16).hex()}"
-    if session_id not in conversations:
-        conversations[session_id] = {
-            "history": [],
-            "disease_context": {}
-        }
+async def start_session(request: SessionRequest, response: Response):
+    session_id = await conversations.create(request.session_id)
+    add_session_hint(response, session_id)
     return {"session_id": session_id}
 
 @app.post("/api/diagnose", response_model=DiagnosisResponse)
-async def diagnose(request: DiagnosisRequest):
+async def diagnose(request: DiagnosisRequest, response: Response):
     """
     Endpoint for diagnosis requests.
     Receives JSON data, which can include ML model predictions or text descriptions.
     """
-    return await diagnose_crop(request)
+    result = await diagnose_crop(request)
+    add_session_hint(response, result.session_id)
+    return result
+
+@app.post("/api/diagnose/stream")
+async def diagnose_stream(request: DiagnosisRequest):
+    """
+    Streaming variant of /api/diagnose, as server-sent events (see stream_diagnosis).
+    """
+    session_id = await conversations.create(request.session_id)
+    response = StreamingResponse(
+        stream_diagnosis(request, session_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    add_session_hint(response, session_id)
+    return response
 
 @app.post("/api/chat", response_model=ChatResponse)
-async def chat_with_bot(request: ChatRequest):
+async def chat_with_bot(request: ChatRequest, response: Response):
     session_id = request.session_id
-    if not session_id or session_id not in conversations:
+    session = await conversations.get(session_id)
+    if session is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid or missing session_id. Please start a diagnosis first."
         )
 
-    history = conversations[session_id]["history"]
-    disease_context = conversations[session_id]["disease_context"]
-
-    # Add user message to history
-    history.append({"sender": "user", "text": request.message})
+    history = session["history"]
+    disease_context = session["disease_context"]
 
-    prompt = create_chat_prompt(request.message, history, disease_context)
-    ai_response_text = await get_gemini_response(prompt)
+    # Only the new message and compact context are sent; earlier turns go as chat history
+    prompt = create_chat_prompt(request.message, disease_context, session["summary"])
+    ai_response_text = await get_gemini_response(prompt, recent_turns(history, CONTEXT_TOKEN_BUDGET))
 
-    # Add AI response to history
-    history.append({"sender": "bot", "text": ai_response_text})
+    # Add the exchange to history
+    new_turns = [{"sender": "user", "text": request.message}, {"sender": "bot", "text": ai_response_text}]
+    await conversations.append_history(session_id, *new_turns)
+    maybe_summarize(session_id, history + new_turns, session["summary"])
 
+    add_session_hint(response, session_id)
     return ChatResponse(response=ai_response_text, session_id=session_id)
 
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Streaming variant of /api/chat, as server-sent events (see stream_chat)."""
+    session = await conversations.get(request.session_id)
+    if session is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid or missing session_id. Please start a diagnosis first."
+        )
+    response = StreamingResponse(
+        stream_chat(request, session),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    add_session_hint(response, request.session_id)
+    return response
+
 # --- Server Execution ---
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,181 @@
+"""
+Per-crop climate envelopes for ranking all crops in O(#crops).
+
+Each crop in crop_data.json is summarized by its centroid, covariance and
+min/max range per feature. A query is scored against every crop by its
+Mahalanobis distance to the crop's centroid, so ranking costs one small
+matrix operation per crop instead of a pass over every sample.
+
+Precompute the envelopes with:
+    python crop_envelopes.py [--out crop_envelopes.json]
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+from crop_recommender import DEFAULT_DATA_PATH, FEATURES
+
+DEFAULT_ENVELOPES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "crop_envelopes.json")
+
+# Added to the covariance diagonal, relative to the feature variance, so
+# crops with (near) constant features still have an invertible covariance
+RIDGE = 1e-3
+
+
+class CropEnvelopes:
+    def __init__(self, crop_names, centroid, covariance, minimum, maximum, counts):
+        self.crop_names = list(crop_names)
+        self.centroid = np.asarray(centroid, dtype=np.float64)
+        self.covariance = np.asarray(covariance, dtype=np.float64)
+        self.minimum = np.asarray(minimum, dtype=np.float64)
+        self.maximum = np.asarray(maximum, dtype=np.float64)
+        self.counts = np.asarray(counts, dtype=np.int64)
+
+        # Inverse covariances for queries with and without rainfall. The
+        # (temperature, humidity) marginal is the top-left 2x2 block.
+        self.precision = np.linalg.inv(self.covariance)
+        self.precision_no_rain = np.linalg.inv(self.covariance[:, :2, :2])
+
+    @classmethod
+    def from_recommender(cls, recommender):
+        features = recommender.features.astype(np.float64)
+        codes = np.asarray(recommender.codes)
+        ridge = RIDGE * np.diag(features.var(axis=0)) if len(features) else 0
+
+        n_crops, n_features = len(recommender.crop_names), len(FEATURES)
+        centroid = np.zeros((n_crops, n_features))
+        covariance = np.tile(np.eye(n_features), (n_crops, 1, 1))
+        minimum = np.zeros((n_crops, n_features))
+        maximum = np.zeros((n_crops, n_features))
+        counts = np.bincount(codes, minlength=n_crops)
+
+        for code in range(n_crops):
+            rows = features[codes == code]
+            if not len(rows):
+                continue
+            centroid[code] = rows.mean(axis=0)
+            minimum[code] = rows.min(axis=0)
+            maximum[code] = rows.max(axis=0)
+            if len(rows) > 1:
+                covariance[code] = np.cov(rows, rowvar=False) + ridge
+
+        return cls(recommender.crop_names, centroid, covariance, minimum, maximum, counts)
+
+    def save(self, path=DEFAULT_ENVELOPES_PATH, json_path=DEFAULT_DATA_PATH):
+        """Writes the envelopes, recording the mtime of the dataset they were built from."""
+        envelopes = {
+            name: {
+                "count": int(self.counts[code]),
+                "centroid": self.centroid[code].tolist(),
+                "covariance": self.covariance[code].tolist(),
+                "min": self.minimum[code].tolist(),
+                "max": self.maximum[code].tolist(),
+            }
+            for code, name in enumerate(self.crop_names)
+        }
+        with open(path, "w") as file:
+            json.dump({
+                "features": list(FEATURES),
+                "source_mtime": os.path.getmtime(json_path) if os.path.exists(json_path) else 0,
+                "crops": envelopes,
+            }, file, indent=2)
+
+    @classmethod
+    def load(cls, path=DEFAULT_ENVELOPES_PATH):
+        with open(path, "r") as file:
+            crops = json.load(file)["crops"]
+
+        names = list(crops)
+        return cls(
+            names,
+            [crops[name]["centroid"] for name in names],
+            [crops[name]["covariance"] for name in names],
+            [crops[name]["min"] for name in names],
+            [crops[name]["max"] for name in names],
+            [crops[name]["count"] for name in names],
+        )
+
+    def __len__(self):
+        return len(self.crop_names)
+
+    def distances(self, temperature, humidity, rainfall=None):
+        """Returns the squared Mahalanobis distance of the query to every crop centroid."""
+        if rainfall is None:
+            delta = np.array([temperature, humidity], dtype=np.float64) - self.centroid[:, :2]
+            precision = self.precision_no_rain
+        else:
+            delta = np.array([temperature, humidity, rainfall], dtype=np.float64) - self.centroid
+            precision = self.precision
+        return np.einsum("ci,cij,cj->c", delta, precision, delta)
+
+    def rank(self, temperature, humidity, rainfall=None, top_n=None):
+        """
+        Ranks every crop by how well the query fits its climate envelope.
+
+        Parameters:
+            temperature (float): Temperature in °C
+            humidity (float): Relative humidity in %
+            rainfall (float): Monthly rainfall in mm, or None to ignore rainfall
+            top_n (int): Number of crops to return, or None for all of them
+
+        Returns:
+            list: (crop_name, suitability) tuples, best first. Suitability is
+                exp(-d²/2) for Mahalanobis distance d, 1.0 at the centroid.
+        """
+        d2 = self.distances(temperature, humidity, rainfall)
+        order = np.argsort(d2, kind="stable")[:top_n]
+        return [(self.crop_names[code], float(np.exp(-0.5 * d2[code]))) for code in order]
+
+    def rank_many(self, points, top_n=None, batch_size=4096):
+        """
+        Batched rank() for an (n, 3) array of (temperature, humidity, rainfall)
+        points, or (n, 2) to ignore rainfall.
+
+        Returns:
+            tuple: (codes, suitability) arrays of shape (n, top_n), best first
+        """
+        points = np.asarray(points, dtype=np.float64)
+        n_features = points.shape[1]
+        centroid = self.centroid[:, :n_features]
+        precision = self.precision if n_features == 3 else self.precision_no_rain
+        codes, scores = [], []
+        for start in range(0, len(points), batch_size):
+            delta = points[start:start + batch_size, None, :] - centroid
+            d2 = np.einsum("nci,cij,ncj->nc", delta, precision, delta)
+            order = np.argsort(d2, axis=1, kind="stable")[:, :top_n]
+            codes.append(order)
+            scores.append(np.exp(-0.5 * np.take_along_axis(d2, order, axis=1)))
+        return np.concatenate(codes), np.concatenate(scores)
+
+    def in_range(self, temperature, humidity, rainfall=None):
+        """Returns the names of crops whose observed min/max range contains the query."""
+        point = np.array([temperature, humidity, rainfall if rainfall is not None else np.nan])
+        n = 2 if rainfall is None else 3
+        inside = np.all((self.minimum[:, :n] <= point[:n]) & (point[:n] <= self.maximum[:, :n]), axis=1)
+        return [self.crop_names[code] for code in np.flatnonzero(inside)]
+
+
+def is_fresh(path=DEFAULT_ENVELOPES_PATH, json_path=DEFAULT_DATA_PATH):
+    """True if the envelopes exist and were built from the current version of json_path."""
+    if not os.path.exists(path):
+        return False
+    if not os.path.exists(json_path):
+        return True
+
+    with open(path, "r") as file:
+        source_mtime = json.load(file).get("source_mtime", 0)
+    return source_mtime >= os.path.getmtime(json_path)
+
+
+if __name__ == "__main__":
+    from index import get_recommender
+
+    parser = argparse.ArgumentParser(description="Precompute per-crop climate envelopes.")
+    parser.add_argument("--out", default=DEFAULT_ENVELOPES_PATH, help="Output JSON path")
+    args = parser.parse_args()
+
+    envelopes = CropEnvelopes.from_recommender(get_recommender())
+    envelopes.save(args.out)
+    print(f"Wrote {len(envelopes)} crop envelopes to {args.out}")
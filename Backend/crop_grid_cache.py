@@ -0,0 +1,270 @@
+"""
+Quantized (temperature, humidity, rainfall) lookup for crop recommendations.
+
+Weather inputs cluster heavily (humidity arrives as an integer, temperature
+at 0.01 °C), so answers are memoized per grid bucket. Buckets are answered
+at their centre, which makes the lazy LRU mode and the precomputed table
+return identical results.
+
+Precompute a full grid with:
+    python crop_grid_cache.py --temperature 0:50 --humidity 0:100 --rainfall 0:500 --out crop_grid_table.npz
+and the top-N envelope rankings used by the location endpoints with:
+    python crop_grid_cache.py --method envelope --top-n 5 --out crop_rank_table.npz
+"""
+import argparse
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "crop_grid_table.npz")
+DEFAULT_RANK_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "crop_rank_table.npz")
+
+# Bucket size per feature: °C, % humidity, mm rainfall
+DEFAULT_BUCKET = (0.5, 1.0, 5.0)
+
+
+class QuantizedCropCache:
+    """
+    Bucketed memo cache in front of a recommender.
+
+    `engine` must provide recommend(temperature, humidity, rainfall=None),
+    recommend_many(points) and crop_names, like CropKNNIndex; rank() only
+    needs rank(temperature, humidity, rainfall, top_n=...), so it also works
+    in front of CropEnvelopes, whose rank_many() lets precompute_rankings()
+    fill a table of the top-N crops per bucket. Queries inside a precomputed
+    grid are table lookups; everything else goes through a bounded LRU cache
+    (maxsize=0 disables it). Answers are computed at the bucket centre, so
+    they are approximations at the resolution of `bucket`.
+    """
+
+    def __init__(self, engine, bucket=DEFAULT_BUCKET, maxsize=4096):
+        self.engine = engine
+        self.bucket = tuple(float(step) for step in bucket)
+        self.maxsize = maxsize
+        self._lru = OrderedDict()
+        self._grid = None
+        self._rankings = None
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, temperature, humidity, rainfall=None):
+        """Returns the integer bucket indices of a query; rainfall stays None if missing."""
+        t_step, h_step, r_step = self.bucket
+        return (
+            int(np.floor(temperature / t_step + 0.5)),
+            int(np.floor(humidity / h_step + 0.5)),
+            None if rainfall is None else int(np.floor(rainfall / r_step + 0.5)),
+        )
+
+    def _centre(self, key):
+        t, h, r = key
+        t_step, h_step, r_step = self.bucket
+        return t * t_step, h * h_step, None if r is None else r * r_step
+
+    @staticmethod
+    def _cell(origin, shape, key):
+        """Index of the key's bucket in a table starting at origin, None if outside it."""
+        cell = tuple(int(k - o) for k, o in zip(key, origin) if k is not None)
+        if all(0 <= i < n for i, n in zip(cell, shape)):
+            return cell
+        return None
+
+    def _grid_lookup(self, key):
+        if self._grid is None:
+            return None
+        origin, table, table_no_rain = self._grid
+        table = table if key[2] is not None else table_no_rain
+        cell = self._cell(origin, table.shape, key)
+        return None if cell is None else self.engine.crop_names[table[cell]]
+
+    def _rank_lookup(self, key, top_n):
+        if self._rankings is None:
+            return None
+        origin, codes, scores, codes_no_rain, scores_no_rain = self._rankings
+        if key[2] is None:
+            codes, scores = codes_no_rain, scores_no_rain
+        # Only rankings at least as long as the request can answer it
+        if (top_n or len(self.engine.crop_names)) > codes.shape[-1]:
+            return None
+        cell = self._cell(origin, codes.shape[:-1], key)
+        if cell is None:
+            return None
+        return [
+            (self.engine.crop_names[code], float(score))
+            for code, score in zip(codes[cell][:top_n], scores[cell][:top_n])
+        ]
+
+    def recommend(self, temperature, humidity, rainfall=None):
+        key = self.key(temperature, humidity, rainfall)
+
+        crop = self._grid_lookup(key)
+        if crop is not None:
+            self.hits += 1
+            return crop
+
+        if key in self._lru:
+            self.hits += 1
+            self._lru.move_to_end(key)
+            return self._lru[key]
+
+        self.misses += 1
+        crop = self.engine.recommend(*self._centre(key))
+        if self.maxsize > 0:
+            self._lru[key] = crop
+            if len(self._lru) > self.maxsize:
+                self._lru.popitem(last=False)
+        return crop
+
+    def rank(self, temperature, humidity, rainfall=None, top_n=None):
+        """Returns engine.rank() for the query's bucket, as a list of (crop_name, score) tuples."""
+        key = self.key(temperature, humidity, rainfall)
+
+        ranking = self._rank_lookup(key, top_n)
+        if ranking is not None:
+            self.hits += 1
+            return ranking
+
+        key = (top_n,) + key
+        if key in self._lru:
+            self.hits += 1
+            self._lru.move_to_end(key)
+            return list(self._lru[key])
+
+        self.misses += 1
+        ranking = self.engine.rank(*self._centre(key[1:]), top_n=top_n)
+        if self.maxsize > 0:
+            self._lru[key] = ranking
+            if len(self._lru) > self.maxsize:
+                self._lru.popitem(last=False)
+        return list(ranking)
+
+    def _bucket_centres(self, temperature_range, humidity_range, rainfall_range):
+        """Returns the first bucket, the grid shape and the bucket centres with and without rainfall."""
+        low = self.key(temperature_range[0], humidity_range[0], rainfall_range[0])
+        high = self.key(temperature_range[1], humidity_range[1], rainfall_range[1])
+        axes = [np.arange(lo, hi + 1) * step for lo, hi, step in zip(low, high, self.bucket)]
+        shape = tuple(len(axis) for axis in axes)
+        grid = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, 3)
+        grid_no_rain = np.stack(np.meshgrid(*axes[:2], indexing="ij"), axis=-1).reshape(-1, 2)
+        return np.array(low), shape, grid, grid_no_rain
+
+    def _code_dtype(self):
+        return np.uint8 if len(self.engine.crop_names) <= 256 else np.uint16
+
+    def precompute(self, temperature_range, humidity_range, rainfall_range):
+        """
+        Fills a dense table for every bucket in the given (low, high) ranges,
+        with and without rainfall, using one batched recommend_many call each.
+        """
+        origin, shape, grid, grid_no_rain = self._bucket_centres(temperature_range, humidity_range, rainfall_range)
+        code_of = {name: code for code, name in enumerate(self.engine.crop_names)}
+        dtype = self._code_dtype()
+
+        table = np.array([code_of[name] for name in self.engine.recommend_many(grid)], dtype=dtype)
+        table_no_rain = np.array([code_of[name] for name in self.engine.recommend_many(grid_no_rain)], dtype=dtype)
+
+        self._grid = (origin, table.reshape(shape), table_no_rain.reshape(shape[:2]))
+
+    def precompute_rankings(self, temperature_range, humidity_range, rainfall_range, top_n):
+        """
+        Stores the engine's top_n ranking (crop codes and scores) for every
+        bucket in the given ranges, with and without rainfall, using the
+        engine's batched rank_many(points, top_n). rank() then answers any
+        top_n up to this one from the table.
+        """
+        origin, shape, grid, grid_no_rain = self._bucket_centres(temperature_range, humidity_range, rainfall_range)
+        dtype = self._code_dtype()
+        codes, scores = self.engine.rank_many(grid, top_n)
+        codes_no_rain, scores_no_rain = self.engine.rank_many(grid_no_rain, top_n)
+        width = codes.shape[-1]
+        self._rankings = (
+            origin,
+            codes.astype(dtype).reshape(shape + (width,)),
+            scores.astype(np.float32).reshape(shape + (width,)),
+            codes_no_rain.astype(dtype).reshape(shape[:2] + (width,)),
+            scores_no_rain.astype(np.float32).reshape(shape[:2] + (width,)),
+        )
+
+    def save(self, path=DEFAULT_TABLE_PATH):
+        """Writes the precomputed recommendation grid and/or rankings to one .npz file."""
+        if self._grid is None and self._rankings is None:
+            raise ValueError("No precomputed grid to save, call precompute() or precompute_rankings() first")
+        arrays = {}
+        if self._grid is not None:
+            arrays.update(zip(("origin", "table", "table_no_rain"), self._grid))
+        if self._rankings is not None:
+            arrays.update(zip(
+                ("rank_origin", "rank_codes", "rank_scores", "rank_codes_no_rain", "rank_scores_no_rain"),
+                self._rankings,
+            ))
+        np.savez_compressed(
+            path,
+            bucket=np.array(self.bucket),
+            crop_names=np.array(self.engine.crop_names),
+            **arrays,
+        )
+
+    def load(self, path=DEFAULT_TABLE_PATH):
+        """Loads a saved grid; its bucket size and crop list must match this cache's engine."""
+        with np.load(path) as data:
+            if tuple(data["bucket"]) != self.bucket:
+                raise ValueError(f"Grid at {path} uses bucket {tuple(data['bucket'])}, expected {self.bucket}")
+            if list(data["crop_names"]) != list(self.engine.crop_names):
+                raise ValueError(f"Grid at {path} was built for a different crop list")
+            if "table" in data:
+                self._grid = (data["origin"], data["table"], data["table_no_rain"])
+            if "rank_codes" in data:
+                self._rankings = tuple(data[name] for name in (
+                    "rank_origin", "rank_codes", "rank_scores", "rank_codes_no_rain", "rank_scores_no_rain",
+                ))
+
+    def clear(self):
+        self._lru.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "lru_size": len(self._lru),
+            "grid_buckets": 0 if self._grid is None else int(self._grid[1].size + self._grid[2].size),
+            "ranked_buckets": 0 if self._rankings is None else int(
+                self._rankings[1][..., 0].size + self._rankings[3][..., 0].size
+            ),
+        }
+
+
+def _parse_range(value):
+    low, high = value.split(":")
+    return float(low), float(high)
+
+
+if __name__ == "__main__":
+    from index import get_envelopes, get_knn_index
+
+    parser = argparse.ArgumentParser(description="Precompute the quantized crop recommendation grid.")
+    parser.add_argument("--method", choices=("knn", "envelope"), default="knn",
+                        help="knn: best crop per bucket, envelope: top-N ranking per bucket")
+    parser.add_argument("--top-n", type=int, default=5, help="Crops ranked per bucket with --method envelope")
+    parser.add_argument("--temperature", type=_parse_range, default=(0, 50), help="low:high in °C")
+    parser.add_argument("--humidity", type=_parse_range, default=(0, 100), help="low:high in %%")
+    parser.add_argument("--rainfall", type=_parse_range, default=(0, 500), help="low:high in mm")
+    parser.add_argument("--bucket", default=",".join(map(str, DEFAULT_BUCKET)), help="t,h,r bucket sizes")
+    parser.add_argument("--out", help="Output .npz path, crop_grid_table.npz or crop_rank_table.npz by method")
+    args = parser.parse_args()
+
+    bucket = [float(x) for x in args.bucket.split(",")]
+    if args.method == "envelope":
+        cache = QuantizedCropCache(get_envelopes(), bucket=bucket)
+        cache.precompute_rankings(args.temperature, args.humidity, args.rainfall, args.top_n)
+        out = args.out or DEFAULT_RANK_TABLE_PATH
+        buckets = cache.stats()["ranked_buckets"]
+    else:
+        cache = QuantizedCropCache(get_knn_index(), bucket=bucket)
+        cache.precompute(args.temperature, args.humidity, args.rainfall)
+        out = args.out or DEFAULT_TABLE_PATH
+        buckets = cache.stats()["grid_buckets"]
+    cache.save(out)
+    print(f"Wrote {buckets} buckets to {out}")
@@ -0,0 +1,122 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+# Query points voted per block in recommend_many, bounds the (points x crops) vote matrix
+BATCH_SIZE = 4096
+
+
+class CropKNNIndex:
+    """
+    k-nearest-neighbour crop lookup backed by KD-trees.
+
+    Features are standardized (zero mean, unit variance) before indexing so
+    rainfall in hundreds of mm does not swamp temperature and humidity. Two
+    trees are kept: one over (temperature, humidity, rainfall) and one over
+    (temperature, humidity) for queries without a rainfall value.
+    """
+
+    def __init__(self, features, codes, crop_names, leafsize=32):
+        features = np.asarray(features, dtype=np.float64)
+        self.codes = np.asarray(codes)
+        self.crop_names = list(crop_names)
+
+        self.mean = features.mean(axis=0)
+        std = features.std(axis=0)
+        self.std = np.where(std > 0, std, 1.0)
+
+        scaled = (features - self.mean) / self.std
+        self.tree = cKDTree(scaled, leafsize=leafsize)
+        self.tree_no_rain = cKDTree(scaled[:, :2], leafsize=leafsize)
+
+    @classmethod
+    def from_recommender(cls, recommender, **kwargs):
+        return cls(recommender.features, recommender.codes, recommender.crop_names, **kwargs)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def _query(self, temperature, humidity, rainfall, k):
+        k = min(k, len(self))
+        if rainfall is None:
+            point = (np.array([temperature, humidity]) - self.mean[:2]) / self.std[:2]
+            dist, idx = self.tree_no_rain.query(point, k=k)
+        else:
+            point = (np.array([temperature, humidity, rainfall]) - self.mean) / self.std
+            dist, idx = self.tree.query(point, k=k)
+        return np.atleast_1d(dist), np.atleast_1d(idx)
+
+    def rank(self, temperature, humidity, rainfall=None, k=15, top_n=5, weighted=True):
+        """
+        Ranks crops by the votes of the k nearest samples.
+
+        Parameters:
+            temperature (float): Temperature in °C
+            humidity (float): Relative humidity in %
+            rainfall (float): Monthly rainfall in mm, or None to ignore rainfall
+            k (int): Number of neighbours that vote
+            top_n (int): Number of crops to return
+            weighted (bool): Weight votes by inverse distance instead of one vote each
+
+        Returns:
+            list: (crop_name, score) tuples, best first, scores summing to at most 1
+        """
+        if not len(self):
+            return []
+
+        dist, idx = self._query(temperature, humidity, rainfall, k)
+        votes = 1.0 / (dist + 1e-6) if weighted else np.ones_like(dist)
+
+        totals = np.bincount(self.codes[idx], weights=votes, minlength=len(self.crop_names))
+        totals /= totals.sum()
+
+        order = np.argsort(-totals, kind="stable")[:top_n]
+        return [(self.crop_names[code], float(totals[code])) for code in order if totals[code] > 0]
+
+    def recommend(self, temperature, humidity, rainfall=None, k=15, weighted=True):
+        """Returns the best-voted crop name, or None if the dataset is empty."""
+        ranking = self.rank(temperature, humidity, rainfall, k=k, top_n=1, weighted=weighted)
+        return ranking[0][0] if ranking else None
+
+    def recommend_many(self, points, k=15, weighted=True):
+        """
+        Recommends the best-voted crop for every row of `points`.
+
+        Parameters:
+            points: array-like of shape (n, 2) with (temperature, humidity) or
+                (n, 3) with (temperature, humidity, rainfall). Rows with a NaN
+                rainfall are looked up in the 2-D index.
+
+        Returns:
+            list: One crop name per input row
+        """
+        points = np.asarray(points, dtype=np.float64)
+        if points.ndim != 2 or points.shape[1] not in (2, 3):
+            raise ValueError("points must have shape (n, 2) or (n, 3)")
+        if not len(self):
+            return [None] * len(points)
+
+        no_rain = np.ones(len(points), dtype=bool) if points.shape[1] == 2 else np.isnan(points[:, 2])
+        best = np.empty(len(points), dtype=np.intp)
+        best[no_rain] = self._vote_many(self.tree_no_rain, points[no_rain, :2], k, weighted)
+        best[~no_rain] = self._vote_many(self.tree, points[~no_rain], k, weighted)
+
+        return [self.crop_names[code] for code in best]
+
+    def _vote_many(self, tree, points, k, weighted):
+        n_features = points.shape[1]
+        scaled = (points - self.mean[:n_features]) / self.std[:n_features]
+        k = min(k, len(self))
+        best = np.empty(len(points), dtype=np.intp)
+
+        for start in range(0, len(points), BATCH_SIZE):
+            dist, idx = tree.query(scaled[start:start + BATCH_SIZE], k=k)
+            dist, idx = dist.reshape(len(dist), -1), idx.reshape(len(idx), -1)
+            votes = 1.0 / (dist + 1e-6) if weighted else np.ones_like(dist)
+
+            totals = np.zeros((len(idx), len(self.crop_names)))
+            rows = np.repeat(np.arange(len(idx)), idx.shape[1])
+            np.add.at(totals, (rows, self.codes[idx].ravel()), votes.ravel())
+            best[start:start + len(idx)] = np.argmax(totals, axis=1)
+
+        return best
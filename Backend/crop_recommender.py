@@ -0,0 +1,109 @@
+import json
+import os
+
+import numpy as np
+
+DEFAULT_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "crop_data.json")
+
+# Column order of the feature matrix
+FEATURES = ("temperature", "humidity", "rainfall")
+
+
+class CropRecommender:
+    """
+    Nearest-neighbour crop recommender over the crop_data.json samples.
+
+    The dataset is loaded once into contiguous float32 columns plus integer
+    crop codes, so every query is a single vectorized distance computation
+    instead of a re-parse of the JSON file and a Python loop over the rows.
+    """
+
+    # Rows scored per block in recommend_many, bounds the (points x samples) matrix
+    BATCH_SIZE = 4096
+
+    def __init__(self, temperature, humidity, rainfall, codes, crop_names):
+        # float32 contiguous inputs (e.g. memory-mapped columns) are used without copying
+        self.temperature = np.ascontiguousarray(temperature, dtype=np.float32)
+        self.humidity = np.ascontiguousarray(humidity, dtype=np.float32)
+        self.rainfall = np.ascontiguousarray(rainfall, dtype=np.float32)
+        self.codes = np.asarray(codes)
+        self.crop_names = list(crop_names)
+
+    @classmethod
+    def from_json(cls, path=DEFAULT_DATA_PATH):
+        with open(path, "r") as file:
+            rows = json.load(file)
+
+        crop_names = []
+        name_to_code = {}
+        features = np.empty((len(rows), len(FEATURES)), dtype=np.float32)
+        codes = np.empty(len(rows), dtype=np.int32)
+
+        for i, row in enumerate(rows):
+            name = row.get("crop_name")
+            if name not in name_to_code:
+                name_to_code[name] = len(crop_names)
+                crop_names.append(name)
+            codes[i] = name_to_code[name]
+            features[i] = [row.get(key) for key in FEATURES]
+
+        return cls(features[:, 0], features[:, 1], features[:, 2], codes, crop_names)
+
+    @property
+    def features(self):
+        """(n, 3) float32 matrix of (temperature, humidity, rainfall), built on access."""
+        return np.column_stack((self.temperature, self.humidity, self.rainfall))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def nearest(self, temperature, humidity, rainfall=None):
+        """Returns the row index of the closest sample, or None if the dataset is empty."""
+        if not len(self):
+            return None
+
+        dist = (self.temperature - np.float32(temperature)) ** 2
+        dist += (self.humidity - np.float32(humidity)) ** 2
+        if rainfall is not None:
+            dist += (self.rainfall - np.float32(rainfall)) ** 2
+
+        return int(np.argmin(dist))
+
+    def recommend(self, temperature, humidity, rainfall=None):
+        """Returns the crop name of the closest sample, or None if the dataset is empty."""
+        index = self.nearest(temperature, humidity, rainfall)
+        if index is None:
+            return None
+        return self.crop_names[self.codes[index]]
+
+    def recommend_many(self, points):
+        """
+        Recommends a crop for every row of `points`.
+
+        Parameters:
+            points: array-like of shape (n, 2) with (temperature, humidity) or
+                (n, 3) with (temperature, humidity, rainfall). A NaN rainfall
+                drops the rainfall term for that row, like rainfall=None.
+
+        Returns:
+            list: One crop name per input row
+        """
+        points = np.asarray(points, dtype=np.float32)
+        if points.ndim != 2 or points.shape[1] not in (2, 3):
+            raise ValueError("points must have shape (n, 2) or (n, 3)")
+        if not len(self):
+            return [None] * len(points)
+
+        best = np.empty(len(points), dtype=np.intp)
+        for start in range(0, len(points), self.BATCH_SIZE):
+            block = points[start:start + self.BATCH_SIZE]
+
+            dist = (block[:, 0:1] - self.temperature) ** 2
+            dist += (block[:, 1:2] - self.humidity) ** 2
+            if block.shape[1] == 3:
+                rain = (block[:, 2:3] - self.rainfall) ** 2
+                dist += np.where(np.isnan(rain), np.float32(0), rain)
+
+            best[start:start + len(block)] = np.argmin(dist, axis=1)
+
+        return [self.crop_names[code] for code in self.codes[best]]
@@ -0,0 +1,93 @@
+"""
+Compact columnar storage for the crop training table.
+
+crop_data.json repeats every key and crop name on each row. The build step
+below converts it into one float32 .npy file per feature plus a
+dictionary-encoded crop column, so workers can memory-map the columns at
+startup and share the pages instead of each parsing its own copy.
+
+Build the store with:
+    python crop_store.py [--json crop_data.json] [--out crop_data_store]
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+from crop_recommender import DEFAULT_DATA_PATH, FEATURES, CropRecommender
+
+DEFAULT_STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "crop_data_store")
+
+META_FILE = "meta.json"
+CODES_FILE = "crop_code.npy"
+
+
+def _code_dtype(n_crops):
+    if n_crops <= np.iinfo(np.uint8).max + 1:
+        return np.uint8
+    if n_crops <= np.iinfo(np.uint16).max + 1:
+        return np.uint16
+    return np.uint32
+
+
+def convert(json_path=DEFAULT_DATA_PATH, out_dir=DEFAULT_STORE_DIR):
+    """Converts crop_data.json into the columnar store and returns the store directory."""
+    recommender = CropRecommender.from_json(json_path)
+    os.makedirs(out_dir, exist_ok=True)
+
+    for name in FEATURES:
+        np.save(os.path.join(out_dir, f"{name}.npy"), getattr(recommender, name))
+    codes = recommender.codes.astype(_code_dtype(len(recommender.crop_names)))
+    np.save(os.path.join(out_dir, CODES_FILE), codes)
+
+    meta = {
+        "rows": len(recommender),
+        "features": list(FEATURES),
+        "crop_names": recommender.crop_names,
+        "source": os.path.basename(json_path),
+        "source_mtime": os.path.getmtime(json_path),
+    }
+    with open(os.path.join(out_dir, META_FILE), "w") as file:
+        json.dump(meta, file, indent=2)
+
+    return out_dir
+
+
+def is_fresh(store_dir=DEFAULT_STORE_DIR, json_path=DEFAULT_DATA_PATH):
+    """True if the store exists and was built from the current version of json_path."""
+    meta_path = os.path.join(store_dir, META_FILE)
+    if not os.path.exists(meta_path):
+        return False
+    if not os.path.exists(json_path):
+        return True
+
+    with open(meta_path, "r") as file:
+        meta = json.load(file)
+    return meta.get("source_mtime", 0) >= os.path.getmtime(json_path)
+
+
+def load(store_dir=DEFAULT_STORE_DIR, mmap=True):
+    """Loads a CropRecommender from the store, memory-mapping the columns by default."""
+    with open(os.path.join(store_dir, META_FILE), "r") as file:
+        meta = json.load(file)
+
+    mmap_mode = "r" if mmap else None
+    columns = [np.load(os.path.join(store_dir, f"{name}.npy"), mmap_mode=mmap_mode) for name in FEATURES]
+    codes = np.load(os.path.join(store_dir, CODES_FILE), mmap_mode=mmap_mode)
+
+    if len(codes) != meta["rows"] or any(len(column) != meta["rows"] for column in columns):
+        raise ValueError(f"Corrupt crop store at {store_dir}: column lengths do not match meta.json")
+
+    return CropRecommender(*columns, codes, meta["crop_names"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert crop_data.json into the columnar crop store.")
+    parser.add_argument("--json", default=DEFAULT_DATA_PATH, help="Path to crop_data.json")
+    parser.add_argument("--out", default=DEFAULT_STORE_DIR, help="Output store directory")
+    args = parser.parse_args()
+
+    out_dir = convert(args.json, args.out)
+    total = sum(os.path.getsize(os.path.join(out_dir, f)) for f in os.listdir(out_dir))
+    print(f"Wrote crop store to {out_dir} ({total} bytes, source {os.path.getsize(args.json)} bytes)")
@@ -0,0 +1,287 @@
+import json
+import re
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # orjson is optional, the standard library parser is used without it
+    _loads = json.loads
+
+# Header wording the model uses for each section, matched case-insensitively
+SECTION_ALIASES = {
+    "disease_name": ["disease name", "disease", "diagnosis", "likely disease", "identified disease"],
+    "causes": ["causes", "cause", "causal agent", "causal agents", "reasons", "why it happens", "pathogen"],
+    "symptoms": ["symptoms", "symptom", "signs", "signs and symptoms", "signs & symptoms", "identification"],
+    "solutions": [
+        "solutions", "solution", "treatment", "treatments", "recommendations", "recommendation",
+        "what to do", "management", "control", "control measures", "remedies", "remedy", "cure",
+        "solutions (treatment/recommendations)", "treatment/recommendations",
+    ],
+    "prevention": [
+        "prevention", "preventive measures", "preventative measures", "how to prevent",
+        "prevention tips", "prevent", "preventing",
+    ],
+}
+
+LIST_SECTIONS = ("causes", "symptoms", "solutions", "prevention")
+
+_ALIAS_TO_SECTION = {alias: section for section, aliases in SECTION_ALIASES.items() for alias in aliases}
+
+# First word of every alias; lines starting with any other word skip the header regex
+_HEADER_WORDS = {re.split(r"[^a-z]", alias)[0] for alias in _ALIAS_TO_SECTION}
+
+# Characters that may precede the first word of a header
+_HEADER_PREFIX = " \t#*_0123456789.)"
+
+# A header line: optional markdown heading / numbering / emphasis around a known alias, then
+# either a colon or dash (content may follow on the same line) or nothing else on the line.
+# A few extra words ("Treatment options:") are allowed on a line that is only a heading.
+HEADER = re.compile(
+    r"^[ \t]*(?:#{1,6}[ \t]*)?(?:\*\*|__)?[ \t]*(?:\d{1,2}[.)][ \t]*)?(?:\*\*|__|\*|_)?[ \t]*"
+    r"(?P<name>" + "|".join(re.escape(alias) for alias in sorted(_ALIAS_TO_SECTION, key=len, reverse=True)) + r")"
+    r"(?P<extra>[ \t]+[^:\n*_()]{1,40}?)??"
+    r"(?:[ \t]*\([^)\n]*\))?[ \t]*(?:\*\*|__|\*|_)?[ \t]*"
+    r"(?:(?P<colon>[:：]|[-–—](?=[ \t]|$))[ \t]*(?:\*\*|__)?[ \t]*(?P<rest>.*?)|)[ \t]*(?:\*\*|__)?[ \t]*$",
+    re.IGNORECASE,
+)
+
+# A list item marker: -, *, •, or 1. / 1)
+BULLET = re.compile(r"^[ \t]*(?:[-*•●▪+]|\d{1,2}[.)])[ \t]+")
+
+# Single * or _ used for italics, left in item text after ** / __ / ` are removed
+ITALICS = re.compile(r"(?<!\w)[*_](?=\S)|(?<=\S)[*_](?!\w)")
+
+FIRST_SENTENCE = re.compile(r"^(.*?)\.")
+
+
+def _clean(text):
+    """Strips markdown emphasis, code and heading markers from item text."""
+    text = text.replace("**", "").replace("__", "").replace("`", "").lstrip(" \t#")
+    if "*" in text or "_" in text:
+        text = ITALICS.sub("", text)
+    return text.strip(" \t:")
+
+
+def match_header(line):
+    """Returns the (section, inline content) of a header line, or None."""
+    word = line.lstrip(_HEADER_PREFIX)[:24].split(None, 1)
+    if not word or word[0].rstrip(":*_-–—(").lower() not in _HEADER_WORDS:
+        return None
+    header = HEADER.match(line)
+    if header is None:
+        return None
+    # Extra words are only allowed on a heading line ending in a colon
+    if header.group("extra") and not (header.group("colon") and not header.group("rest")):
+        return None
+    return _ALIAS_TO_SECTION[header.group("name").lower()], _clean(header.group("rest") or "")
+
+
+class DiagnosisStreamParser:
+    """
+    Splits a Gemini diagnosis into its sections as it is generated, one line
+    at a time.
+
+    Header lines ("Causes:", "**Symptoms**", "## 3. Treatment", ...) switch the
+    current section; list items and plain lines under a header become items
+    of that section. An indented line right after an item continues it, so a
+    list item is only reported once the next line shows it is complete.
+
+    A disease name taken from the opening lines is reported as soon as the
+    title line (or the first header) arrives; a "Disease:" header later in the
+    reply takes precedence and is reported again.
+
+    feed() and close() return the events found so far, as (name, data):
+        ("disease_name", {"disease_name": str})
+        ("section_start", {"section": str}), the first time a list section appears
+        ("item", {"section": str, "text": str})
+    """
+
+    def __init__(self):
+        self.parsed = {"disease_name": None, **{name: [] for name in LIST_SECTIONS}}
+        self.section = None
+        self._first_line = None
+        self._intro = []
+        self._intro_name = None
+        self._continuable = False
+        self._started = set()
+        self._events = []
+        self._buffer = ""
+        self._chunks = []
+
+    def feed(self, chunk):
+        """Parses the complete lines of a streamed chunk of text."""
+        self._chunks.append(chunk)
+        lines = (self._buffer + chunk).split("\n")
+        self._buffer = lines.pop()
+        for line in lines:
+            self.line(line.rstrip("\r"))
+        return self._take_events()
+
+    def close(self):
+        """Parses the last line of the stream; `parsed` then holds the whole diagnosis."""
+        if self._buffer:
+            self.line(self._buffer.rstrip("\r"))
+            self._buffer = ""
+        self.finish()
+        self.parsed["response"] = "".join(self._chunks)
+        return self._take_events()
+
+    def _take_events(self):
+        events, self._events = self._events, []
+        return events
+
+    def _set_name(self, name):
+        self.parsed["disease_name"] = name
+        if name != self._intro_name:
+            self._events.append(("disease_name", {"disease_name": name}))
+
+    def _name_from_intro(self, title_only):
+        """The title line, or the first sentence of the opening paragraph, unless title_only."""
+        intro = self._intro
+        title = _clean(intro[0])
+        if intro[0] is self._first_line and title and len(title) <= 80 and not title.endswith("."):
+            return title
+        if title_only:
+            return None
+        match = FIRST_SENTENCE.match(_clean(" ".join(intro)))
+        return match.group(1).strip() if match else None
+
+    def _report_intro_name(self, title_only):
+        # Reported early but only stored by finish(), so a later "Disease:" header still wins
+        if self._intro_name is None and not self.parsed["disease_name"] and self._intro:
+            self._intro_name = self._name_from_intro(title_only)
+            if self._intro_name:
+                self._events.append(("disease_name", {"disease_name": self._intro_name}))
+
+    def _add_item(self, item):
+        self.parsed[self.section].append(item)
+        self._events.append(("item", {"section": self.section, "text": item}))
+
+    def _end_item(self):
+        # The pending list item can no longer be continued
+        if self._continuable:
+            self._continuable = False
+            self._events.append(("item", {"section": self.section, "text": self.parsed[self.section][-1]}))
+
+    def line(self, line):
+        parsed = self.parsed
+        if not line.strip():
+            self._end_item()
+            return
+        if self._first_line is None:
+            self._first_line = line
+
+        header = match_header(line)
+        if header:
+            self._end_item()
+            if self.section is None:
+                # The opening paragraph is complete
+                self._report_intro_name(title_only=False)
+            self.section, rest = header
+            if self.section == "disease_name":
+                if rest and not parsed["disease_name"]:
+                    self._set_name(rest)
+                return
+            if self.section not in self._started:
+                self._started.add(self.section)
+                self._events.append(("section_start", {"section": self.section}))
+            if rest:
+                self._add_item(rest)
+            return
+
+        if self.section is None:
+            self._intro.append(line)
+            if len(self._intro) == 1:
+                self._report_intro_name(title_only=True)
+            return
+        if self.section == "disease_name":
+            if not parsed["disease_name"]:
+                self._set_name(_clean(line))
+            return
+
+        items = parsed[self.section]
+        bullet = BULLET.match(line)
+        if bullet:
+            item = _clean(line[bullet.end():])
+            if item:
+                self._end_item()
+                items.append(item)
+                self._continuable = True
+        elif self._continuable and items and line[:1] in " \t":
+            items[-1] = f"{items[-1]} {_clean(line)}"
+        else:
+            item = _clean(line)
+            if item:
+                self._end_item()
+                self._add_item(item)
+
+    def finish(self):
+        self._end_item()
+        if not self.parsed["disease_name"] and self._intro:
+            # Otherwise the title line, or the first sentence of the opening paragraph
+            name = self._intro_name or self._name_from_intro(title_only=False)
+            if name:
+                self._set_name(name)
+
+
+def parse_diagnosis(text):
+    """
+    Splits a complete Gemini diagnosis into its sections in one pass over the
+    lines (see DiagnosisStreamParser).
+
+    Returns:
+        {"disease_name": str or None, "causes": [...], "symptoms": [...],
+         "solutions": [...], "prevention": [...], "response": text}
+    """
+    parser = DiagnosisStreamParser()
+    for line in text.splitlines():
+        parser.line(line)
+    parser.finish()
+    parser.parsed["response"] = text
+    return parser.parsed
+
+
+# JSON schema types Gemini's response_schema understands
+_SCHEMA_TYPES = {"string": "string", "number": "number", "integer": "integer", "boolean": "boolean", "array": "array"}
+
+# A ```json ... ``` fence the model sometimes wraps JSON in
+CODE_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+
+
+def _schema_property(prop):
+    nullable = False
+    if "anyOf" in prop:
+        options = [option for option in prop["anyOf"] if option.get("type") != "null"]
+        nullable = len(options) < len(prop["anyOf"])
+        prop = options[0]
+    schema = {"type": _SCHEMA_TYPES[prop["type"]]}
+    if prop["type"] == "array":
+        schema["items"] = _schema_property(prop["items"])
+    if nullable:
+        schema["nullable"] = True
+    return schema
+
+
+def response_schema(model_class, exclude=()):
+    """
+    Gemini response_schema (its OpenAPI subset) for the fields of a pydantic
+    model, leaving out `exclude`. Every field is required so the model always
+    fills it in; Optional fields may be null.
+    """
+    properties = {
+        name: _schema_property(prop)
+        for name, prop in model_class.model_json_schema()["properties"].items()
+        if name not in exclude
+    }
+    return {"type": "object", "properties": properties, "required": list(properties)}
+
+
+def parse_diagnosis_json(text):
+    """
+    Parses a JSON-mode diagnosis reply into a dict, raising ValueError if it
+    is not a JSON object.
+    """
+    data = _loads(CODE_FENCE.sub("", text))
+    if not isinstance(data, dict):
+        raise ValueError(f"Expected a JSON object, got {type(data).__name__}")
+    return data
@@ -0,0 +1,142 @@
+import argparse
+import asyncio
+import json
+import os
+
+from models.disease_classes import CLASS_NAMES
+
+DEFAULT_KB_PATH = os.getenv("DISEASE_KB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "disease_kb.json"))
+
+# Languages the knowledge base is built for, by the codes used in requests
+LANGUAGE_NAMES = {"en": "English", "hi": "Hindi", "pa": "Punjabi"}
+DEFAULT_LANGUAGE = "en"
+
+# Fields stored per class and language
+ENTRY_FIELDS = ("response", "disease_name", "causes", "symptoms", "solutions", "prevention")
+
+
+def language_name(code):
+    return LANGUAGE_NAMES.get((code or DEFAULT_LANGUAGE).lower(), code)
+
+
+class DiseaseKnowledgeBase:
+    """
+    Precomputed diagnosis advice per plant-disease class and language.
+
+    Entries are generated ahead of time by `python disease_kb.py build` and
+    kept in memory as {language: {class: entry}}, so serving one is a dict
+    lookup. Each entry has the fields of ENTRY_FIELDS.
+    """
+
+    def __init__(self, entries=None, path=DEFAULT_KB_PATH):
+        self.entries = entries or {}
+        self.path = path
+
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def load(cls, path=DEFAULT_KB_PATH):
+        """Loads the knowledge base, empty if the file does not exist yet."""
+        if not os.path.exists(path):
+            print(f" No disease knowledge base at {path}, diagnoses will use the LLM")
+            return cls(path=path)
+        with open(path, encoding="utf-8") as file:
+            entries = json.load(file)
+        kb = cls(entries, path)
+        print(f" Loaded disease knowledge base: {kb.size()} entries")
+        return kb
+
+    def save(self, path=None):
+        path = path or self.path
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(self.entries, file, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp_path, path)
+
+    def get(self, class_name, language=None):
+        entry = self.entries.get((language or DEFAULT_LANGUAGE).lower(), {}).get(class_name)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def put(self, class_name, language, entry):
+        self.entries.setdefault(language, {})[class_name] = {field: entry.get(field) for field in ENTRY_FIELDS}
+
+    def contains(self, class_name, language):
+        return class_name in self.entries.get(language, {})
+
+    def size(self):
+        return sum(len(classes) for classes in self.entries.values())
+
+    def stats(self):
+        return {
+            "entries": self.size(),
+            "languages": sorted(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+async def build(kb, classes, languages, concurrency=4, force=False):
+    """
+    Generates the missing (class, language) entries with the diagnosis
+    chatbot's JSON output mode, saving after each one so an interrupted
+    build can be resumed.
+    """
+    # Imported here because it configures the Gemini client on import
+    import crop_diagnosis_chatbot as bot
+
+    jobs = [(name, language) for language in languages for name in classes if force or not kb.contains(name, language)]
+    print(f" Building {len(jobs)} knowledge base entries")
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = 0
+
+    async def one(name, language):
+        nonlocal failures
+        request = bot.DiagnosisRequest(predicted_class=name, confidence=1.0, language=language)
+        prompt = bot.create_disease_diagnosis_prompt(request, [], structured=True)
+        async with semaphore:
+            try:
+                text = await bot.get_gemini_response(prompt, json_mode=True)
+                data = bot.parse_diagnosis_json(text)
+                entry = bot.DiagnosisResponse.model_validate({**data, "session_id": ""}).model_dump()
+            except Exception as e:
+                failures += 1
+                print(f"⚠ {name} ({language}) failed: {e}")
+                return
+        kb.put(name, language, entry)
+        kb.save()
+        print(f" {name} ({language})")
+
+    await asyncio.gather(*(one(name, language) for name, language in jobs))
+    print(f" Done: {kb.size()} entries, {failures} failed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute diagnosis advice per disease class and language.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Generate missing entries with Gemini")
+    build_parser.add_argument("--path", default=DEFAULT_KB_PATH)
+    build_parser.add_argument("--languages", nargs="+", default=list(LANGUAGE_NAMES))
+    build_parser.add_argument("--classes", nargs="+", default=CLASS_NAMES, help="Defaults to every class of the model")
+    build_parser.add_argument("--concurrency", type=int, default=4)
+    build_parser.add_argument("--force", action="store_true", help="Regenerate entries that already exist")
+
+    stats_parser = subparsers.add_parser("stats", help="Show how many entries exist per language")
+    stats_parser.add_argument("--path", default=DEFAULT_KB_PATH)
+
+    args = parser.parse_args()
+    kb = DiseaseKnowledgeBase.load(args.path)
+    if args.command == "build":
+        unknown = set(args.classes) - set(CLASS_NAMES)
+        if unknown:
+            parser.error(f"Unknown classes: {', '.join(sorted(unknown))}")
+        asyncio.run(build(kb, args.classes, args.languages, args.concurrency, args.force))
+    else:
+        for language in sorted(kb.entries):
+            missing = [name for name in CLASS_NAMES if name not in kb.entries[language]]
+            print(f"{language}: {len(kb.entries[language])}/{len(CLASS_NAMES)} classes, missing: {', '.join(missing) or 'none'}")
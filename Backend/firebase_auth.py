@@ -0,0 +1,35 @@
+import asyncio
+import os
+
+from fastapi import HTTPException, Request
+
+# Service account key used to verify Firebase ID tokens
+FIREBASE_CREDENTIALS = os.getenv("FIREBASE_CREDENTIALS", "serviceAuth.json")
+
+
+def init_firebase():
+    """Initializes the Firebase Admin app once, on first use."""
+    import firebase_admin
+    from firebase_admin import credentials
+
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(credentials.Certificate(FIREBASE_CREDENTIALS))
+
+
+def bearer_token(request: Request):
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
+    return auth_header.split("Bearer ")[1]
+
+
+async def verify_token(request: Request):
+    """FastAPI dependency returning the decoded Firebase ID token of the caller, 401 if it is invalid."""
+    token = bearer_token(request)
+    try:
+        init_firebase()
+        from firebase_admin import auth
+        # Verification may fetch Google's public keys, so it runs off the event loop
+        return await asyncio.to_thread(auth.verify_id_token, token)
+    except Exception as e:
+        raise HTTPException(status_code=401, detail="Invalid auth token: " + str(e))
@@ -9,29 +9,102 @@
     
 #   return None
 
-import json
-import math
+from crop_recommender import CropRecommender
+from crop_knn import CropKNNIndex
+from crop_envelopes import CropEnvelopes
+from crop_grid_cache import QuantizedCropCache, DEFAULT_BUCKET, DEFAULT_TABLE_PATH, DEFAULT_RANK_TABLE_PATH
+import crop_envelopes
+import crop_store
+import os
+
+_recommender = None
+_knn_index = None
+_envelopes = None
+_crop_caches = {}
+
+# Bucketed memo cache per ranking method in front of rank_crops and get_cropName. Answers are
+# computed at the bucket centre, so they are approximated at CROP_CACHE_BUCKET resolution
+# (0.5 °C, 1 %, 5 mm by default); CROP_CACHE_SIZE=0 turns it off
+CROP_CACHE_SIZE = int(os.getenv("CROP_CACHE_SIZE", "4096"))
+CROP_CACHE_BUCKET = tuple(float(x) for x in os.getenv("CROP_CACHE_BUCKET", ",".join(map(str, DEFAULT_BUCKET))).split(","))
+# Tables built with crop_grid_cache.py: best crop per bucket (knn) and top-N rankings per bucket (envelope)
+CROP_GRID_TABLE = os.getenv("CROP_GRID_TABLE", DEFAULT_TABLE_PATH)
+CROP_RANK_TABLE = os.getenv("CROP_RANK_TABLE", DEFAULT_RANK_TABLE_PATH)
+
+def get_recommender():
+    """
+    Returns the process-wide recommender, loading it on first use.
+
+    Memory-maps the columnar crop store when it is built and up to date
+    (see crop_store.py), otherwise parses crop_data.json.
+    """
+    global _recommender
+    if _recommender is None:
+        if crop_store.is_fresh():
+            _recommender = crop_store.load()
+        else:
+            print(" Crop store missing or stale, loading crop_data.json (run crop_store.py to build it)")
+            _recommender = CropRecommender.from_json()
+    return _recommender
+
+def get_knn_index():
+    """Returns the process-wide standardized k-NN index built from the recommender's data."""
+    global _knn_index
+    if _knn_index is None:
+        _knn_index = CropKNNIndex.from_recommender(get_recommender())
+    return _knn_index
+
+def get_envelopes():
+    """Returns the per-crop climate envelopes, from crop_envelopes.json if precomputed and up to date."""
+    global _envelopes
+    if _envelopes is None:
+        if crop_envelopes.is_fresh():
+            _envelopes = CropEnvelopes.load()
+        else:
+            if os.path.exists(crop_envelopes.DEFAULT_ENVELOPES_PATH):
+                print(" Crop envelopes stale, recomputing from the crop data (run crop_envelopes.py to rebuild them)")
+            _envelopes = CropEnvelopes.from_recommender(get_recommender())
+    return _envelopes
+
+def rank_crops(temperature, humidity, rainfall=None, top_n=5, method="knn"):
+    """
+    Returns up to top_n (crop_name, score) tuples, best first.
+
+    method="knn" votes over the nearest samples and only returns crops that
+    received votes. method="envelope" scores every crop by Mahalanobis
+    distance to its climate envelope; top_n=None returns all of them.
+    """
+    if method == "knn":
+        top_n = top_n or len(get_recommender().crop_names)
+    elif method != "envelope":
+        raise ValueError(f"Unknown ranking method: {method}")
+
+    if CROP_CACHE_SIZE > 0 or os.path.exists(CROP_RANK_TABLE if method == "envelope" else CROP_GRID_TABLE):
+        return get_crop_cache(method).rank(temperature, humidity, rainfall, top_n=top_n)
+    engine = get_envelopes() if method == "envelope" else get_knn_index()
+    return engine.rank(temperature, humidity, rainfall, top_n=top_n)
+
+def get_crop_cache(method="knn"):
+    """
+    Returns the quantized lookup cache of a ranking method, with its
+    precomputed table (CROP_GRID_TABLE or CROP_RANK_TABLE) loaded if one was built.
+    """
+    cache = _crop_caches.get(method)
+    if cache is None:
+        engine = get_envelopes() if method == "envelope" else get_knn_index()
+        cache = QuantizedCropCache(engine, bucket=CROP_CACHE_BUCKET, maxsize=CROP_CACHE_SIZE)
+        table_path = CROP_RANK_TABLE if method == "envelope" else CROP_GRID_TABLE
+        if os.path.exists(table_path):
+            try:
+                cache.load(table_path)
+            except ValueError as e:
+                print(f" Ignoring crop grid table: {e}")
+        _crop_caches[method] = cache
+    return cache
 
 def get_cropName(temperature, humidity, rainfall=None):
-    with open("crop_data.json", "r") as file:
-        crops = json.load(file)
-
-    best_crop = None
-    best_distance = float("inf")
-
-    for crop in crops:
-        temp = crop.get("temperature")
-        hum = crop.get("humidity")
-        rain = crop.get("rainfall")
-        
-        dist = math.sqrt(
-            (temperature - temp) ** 2 +
-            (humidity - hum) ** 2 +
-            ((rainfall - rain) ** 2 if rainfall is not None else 0)
-        )
-
-        if dist < best_distance:
-            best_distance = dist
-            best_crop = crop.get("crop_name")
-
-    return best_crop or "No suitable crop found"
\ No newline at end of file
+    if CROP_CACHE_SIZE > 0 or os.path.exists(CROP_GRID_TABLE):
+        best_crop = get_crop_cache().recommend(temperature, humidity, rainfall)
+    else:
+        best_crop = get_knn_index().recommend(temperature, humidity, rainfall)
+    return best_crop or "No suitable crop found"
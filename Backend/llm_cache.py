@@ -0,0 +1,123 @@
+import asyncio
+import hashlib
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+def prompt_key(model, prompt):
+    """Hash of the model name and the prompt with whitespace runs collapsed."""
+    normalized = re.sub(r"\s+", " ", prompt).strip()
+    return hashlib.sha256(f"{model}\0{normalized}".encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Exact-match cache of LLM answers keyed on prompt_key(model, prompt).
+
+    Entries live in a bounded in-memory LRU and expire `ttl` seconds after
+    they were generated. With `path` set, entries are also written to a
+    SQLite file (bounded to `disk_maxsize` rows) and read back on a memory
+    miss, so the cache survives restarts. SQLite calls run one at a time on
+    the cache's own thread, never on the event loop.
+    """
+
+    def __init__(self, ttl=3600, maxsize=1024, path=None, disk_maxsize=10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.disk_maxsize = disk_maxsize
+        self._entries = OrderedDict()  # key -> (created_at, answer)
+
+        self.conn = None
+        self._executor = None
+        if path:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm-cache-sqlite")
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY,"
+                " answer TEXT NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_created_at ON llm_cache (created_at)")
+            self.conn.commit()
+
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, key, created_at, answer):
+        self._entries[key] = (created_at, answer)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def _run(self, method, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, method, *args)
+
+    def _load(self, key):
+        return self.conn.execute(
+            "SELECT created_at, answer FROM llm_cache WHERE key = ?", (key,)
+        ).fetchone()
+
+    def _store(self, key, answer, created_at):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO llm_cache (key, answer, created_at) VALUES (?, ?, ?)",
+            (key, answer, created_at),
+        )
+        self.conn.execute(
+            "DELETE FROM llm_cache WHERE created_at < ? OR key IN ("
+            " SELECT key FROM llm_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (created_at - self.ttl, self.disk_maxsize),
+        )
+        self.conn.commit()
+
+    def _clear(self):
+        self.conn.execute("DELETE FROM llm_cache")
+        self.conn.commit()
+
+    async def get(self, model, prompt):
+        """Returns the cached answer, or None if missing or expired."""
+        key = prompt_key(model, prompt)
+        now = time.time()
+
+        entry = self._entries.get(key)
+        if entry is None and self.conn is not None:
+            entry = await self._run(self._load, key)
+            if entry is not None:
+                self._remember(key, *entry)
+
+        if entry is None or now - entry[0] >= self.ttl:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    async def put(self, model, prompt, answer):
+        key = prompt_key(model, prompt)
+        created_at = time.time()
+        self._remember(key, created_at, answer)
+
+        if self.conn is not None:
+            await self._run(self._store, key, answer, created_at)
+
+    async def clear(self):
+        self._entries.clear()
+        if self.conn is not None:
+            await self._run(self._clear)
+
+    async def close(self):
+        if self.conn is not None:
+            await self._run(self.conn.close)
+            self._executor.shutdown()
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "persistent": self.conn is not None,
+        }
@@ -0,0 +1,97 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+
+class SchedulerOverloaded(Exception):
+    """Raised when all LLM slots are busy and the wait queue is full."""
+
+
+class LLMScheduler:
+    """
+    Bounded-concurrency gate for LLM calls.
+
+    At most `max_concurrency` calls run at once and at most `max_queue`
+    callers wait for a slot; anyone beyond that is rejected immediately with
+    SchedulerOverloaded so the server can answer 503 instead of piling up
+    work. Calls made through run() are cancelled after `timeout` seconds.
+    """
+
+    # Number of recent calls kept for the latency percentiles
+    WINDOW = 1000
+
+    def __init__(self, max_concurrency=8, max_queue=32, timeout=60.0):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        self.in_flight = 0
+        self.queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.errors = 0
+        self._latencies = deque(maxlen=self.WINDOW)
+        self._waits = deque(maxlen=self.WINDOW)
+
+    @asynccontextmanager
+    async def slot(self):
+        """Holds one LLM slot for the duration of the block, e.g. for a streamed call."""
+        if self._semaphore.locked() and self.queued >= self.max_queue:
+            self.rejected += 1
+            raise SchedulerOverloaded(
+                f"LLM queue full ({self.in_flight} running, {self.queued} waiting)"
+            )
+
+        self.queued += 1
+        wait_start = time.perf_counter()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+        self._waits.append(time.perf_counter() - wait_start)
+
+        self.in_flight += 1
+        start = time.perf_counter()
+        try:
+            yield
+            self.completed += 1
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self._latencies.append(time.perf_counter() - start)
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    async def run(self, call, timeout=None):
+        """Awaits call() inside a slot, raising asyncio.TimeoutError after the timeout."""
+        async with self.slot():
+            return await asyncio.wait_for(call(), timeout or self.timeout)
+
+    def metrics(self):
+        def percentile(values, p):
+            if not values:
+                return None
+            ordered = sorted(values)
+            return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000, 2)
+
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "latency_ms_p50": percentile(self._latencies, 50),
+            "latency_ms_p95": percentile(self._latencies, 95),
+            "queue_wait_ms_p50": percentile(self._waits, 50),
+            "queue_wait_ms_p95": percentile(self._waits, 95),
+        }
@@ -0,0 +1,52 @@
+from Weather import get_weather_cached
+from index import rank_crops
+
+DEFAULT_LANG = "pa"
+
+# Crops offered to create_advice_prompt_multiple
+TOP_CROPS = 5
+
+
+async def resolve_location_context(latitude=None, longitude=None, lang=DEFAULT_LANG):
+    """
+    Resolves the prompt context for a location.
+
+    Weather comes from the location-keyed weather cache (the server's IP
+    location is used when no coordinates are given) and crops are ranked by
+    climate envelope. If the weather is unavailable the context is still
+    returned, with unknown weather and no crops.
+
+    Returns:
+        dict: city, crops, gps, weather and lang as taken by
+            create_advice_prompt_multiple, plus crop_ranking as
+            (crop_name, score) tuples
+    """
+    weather = await get_weather_cached(latitude, longitude)
+
+    if weather is None:
+        gps = f"{latitude},{longitude}" if latitude is not None and longitude is not None else "unknown"
+        return {
+            "city": "unknown",
+            "crops": [],
+            "gps": gps,
+            "weather": "unavailable",
+            "lang": lang,
+            "crop_ranking": [],
+        }
+
+    latitude, longitude, temperature, weather_desc, city, humidity, rainfall = weather
+    crop_ranking = rank_crops(temperature, humidity, rainfall, top_n=TOP_CROPS, method="envelope")
+
+    return {
+        "city": city,
+        "crops": [name for name, _ in crop_ranking],
+        "gps": f"{latitude},{longitude}",
+        "weather": f"{weather_desc}, {temperature}",
+        "lang": lang,
+        "crop_ranking": crop_ranking,
+    }
+
+
+def prompt_fields(context):
+    """Returns the subset of a location context accepted by create_advice_prompt_multiple."""
+    return {key: context[key] for key in ("city", "crops", "gps", "weather", "lang")}
@@ -12,6 +12,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import io # Import io module for BytesIO
 from fastapi.responses import HTMLResponse # Import HTMLResponse
+from disease_classes import CLASS_NAMES
 
 # Load the TensorFlow Keras model
 model = None
@@ -29,21 +30,7 @@ async def lifespan(app: FastAPI):
     print("Model loaded successfully!")
 
     # Define class names (ensure this matches your model's output)
-    class_name = [
-        'Apple___Apple_scab', 'Apple___Black_rot', 'Apple___Cedar_apple_rust', 'Apple___healthy',
-        'Blueberry___healthy', 'Cherry_(sour)___Powdery_mildew', 'Cherry_(sour)___healthy',
-        'Corn_(maize)___Cercospora_leaf_spot Gray_leaf_spot', 'Corn_(maize)___Common_rust',
-        'Corn_(maize)___Northern_Leaf_Blight', 'Corn_(maize)___healthy', 'Grape___Black_rot',
-        'Grape___Esca_(Black_Measles)', 'Grape___Leaf_blight_(Isariopsis_Leaf_Spot)', 'Grape___healthy',
-        'Orange___Haunglongbing_(Citrus_greening)', 'Peach___Bacterial_spot', 'Peach___healthy',
-        'Pepper,_bell___Bacterial_spot', 'Pepper,_bell___healthy', 'Potato___Early_blight',
-        'Potato___Late_blight', 'Potato___healthy', 'Raspberry___healthy', 'Soybean___healthy',
-        'Squash___Powdery_mildew', 'Strawberry___Leaf_scorch', 'Strawberry___healthy',
-        'Tomato___Bacterial_spot', 'Tomato___Early_blight', 'Tomato___Late_blight', 'Tomato___Leaf_Mold',
-        'Tomato___Septoria_leaf_spot', 'Tomato___Spider_mites Two-spotted_spider_mite',
-        'Tomato___Target_Spot', 'Tomato___Tomato_mosaic_virus', 'Tomato___Tomato_Yellow_Leaf_Curl_Virus',
-        'Tomato___healthy'
-    ]
+    class_name = list(CLASS_NAMES)
     print(f"Loaded {len(class_name)} classes.")
     yield
     # Clean up the model resources (optional)
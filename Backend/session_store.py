@@ -0,0 +1,629 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # Only needed for SESSION_BACKEND=redis
+    aioredis = None
+
+# Default SQLite file for SESSION_BACKEND=sqlite
+DEFAULT_DB_PATH = os.getenv("SESSION_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions.sqlite3"))
+
+# Senders are stored as one letter
+_SENDER_CODES = {"user": "u", "bot": "b"}
+_SENDERS = {code: sender for sender, code in _SENDER_CODES.items()}
+
+
+def new_session_id():
+    return f"session_{os.urandom(16).hex()}"
+
+
+def _dumps(value):
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def encode_turn(turn):
+    """Compact record of a history turn, e.g. ["u","text"]."""
+    return _dumps([_SENDER_CODES.get(turn["sender"], turn["sender"]), turn["text"]])
+
+
+def decode_turn(record):
+    sender, text = json.loads(record)
+    return {"sender": _SENDERS.get(sender, sender), "text": text}
+
+
+def _turn_bytes(turn):
+    return len(turn["text"].encode("utf-8"))
+
+
+def _context_bytes(context):
+    return len(json.dumps(context, default=str).encode("utf-8")) if context else 0
+
+
+class SessionStore:
+    """
+    Store of diagnosis chat sessions.
+
+    A session is {"history": [{"sender", "text"}, ...], "disease_context": {},
+    "summary": str or None}, where summary stands in for turns folded out of
+    the history by fold_history(). Sessions idle for more than `ttl` seconds
+    expire, at most `max_sessions` are kept (the least recently used is
+    evicted first), and each history keeps only its last `max_history` turns.
+    A background sweeper started with start() drops expired sessions every
+    `sweep_interval` seconds.
+    """
+
+    def __init__(self, ttl=3600, max_sessions=10000, max_history=50, sweep_interval=60):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_history = max_history
+        self.sweep_interval = sweep_interval
+        self._sweeper = None
+
+    async def get(self, session_id):
+        """Returns a snapshot of the session, or None if unknown or expired."""
+        raise NotImplementedError
+
+    async def create(self, session_id=None):
+        """Returns the id of an existing live session, or creates it (with a new id if none is given)."""
+        raise NotImplementedError
+
+    async def append_history(self, session_id, *turns):
+        """Atomically appends turns to the history, dropping the oldest beyond max_history."""
+        raise NotImplementedError
+
+    async def update_context(self, session_id, context):
+        """Merges `context` into the session's disease context."""
+        raise NotImplementedError
+
+    async def record_turn(self, session_id, context, *turns):
+        """Atomically merges `context` into the disease context and appends turns, as one update."""
+        raise NotImplementedError
+
+    async def fold_history(self, session_id, turns, summary):
+        """
+        Atomically drops the oldest turns and stores the summary replacing them,
+        only if those turns are still exactly `turns`. Returns False if the
+        history changed meanwhile (another worker folded or trimmed it).
+        """
+        raise NotImplementedError
+
+    async def delete(self, session_id):
+        raise NotImplementedError
+
+    async def sweep(self):
+        """Drops every expired session and returns how many were dropped."""
+        return 0
+
+    async def stats(self):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+    async def _sweep_forever(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                removed = await self.sweep()
+                if removed:
+                    print(f" Swept {removed} expired sessions")
+            except Exception as e:
+                print(f"⚠ Session sweep failed: {e}")
+
+    def start(self):
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_forever())
+
+    async def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+        await self.close()
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Sessions held in this process. Fastest, but a session is only visible to
+    the worker that created it, so use it with a single worker or with
+    sticky sessions.
+    """
+
+    # Sessions are only visible to this process
+    shared = False
+
+    def __init__(self, **limits):
+        super().__init__(**limits)
+        self._sessions = OrderedDict()  # session_id -> session dict, least recently used first
+        self._bytes = 0
+
+        self.expired = 0
+        self.evicted = 0
+
+    def _expired(self, session, now):
+        return now - session["last_seen"] > self.ttl
+
+    def _drop(self, session_id):
+        session = self._sessions.pop(session_id)
+        self._bytes -= session["bytes"]
+
+    def _lookup(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        now = time.monotonic()
+        if self._expired(session, now):
+            self._drop(session_id)
+            self.expired += 1
+            return None
+        session["last_seen"] = now
+        self._sessions.move_to_end(session_id)
+        return session
+
+    async def get(self, session_id):
+        session = self._lookup(session_id) if session_id else None
+        if session is None:
+            return None
+        return {
+            "history": list(session["history"]),
+            "disease_context": dict(session["disease_context"]),
+            "summary": session["summary"],
+        }
+
+    async def create(self, session_id=None):
+        session_id = session_id or new_session_id()
+        if self._lookup(session_id) is None:
+            self._sessions[session_id] = {
+                "history": [],
+                "disease_context": {},
+                "summary": None,
+                "last_seen": time.monotonic(),
+                "bytes": 0,
+            }
+            while len(self._sessions) > self.max_sessions:
+                self._drop(next(iter(self._sessions)))
+                self.evicted += 1
+        return session_id
+
+    async def append_history(self, session_id, *turns):
+        session = self._lookup(session_id)
+        if session is None:
+            return False
+        history = session["history"]
+        history.extend(turns)
+        added = sum(_turn_bytes(turn) for turn in turns)
+        overflow = len(history) - self.max_history
+        if overflow > 0:
+            added -= sum(_turn_bytes(turn) for turn in history[:overflow])
+            del history[:overflow]
+        session["bytes"] += added
+        self._bytes += added
+        return True
+
+    async def update_context(self, session_id, context):
+        session = self._lookup(session_id)
+        if session is None:
+            return False
+        before = _context_bytes(session["disease_context"])
+        session["disease_context"].update(context)
+        change = _context_bytes(session["disease_context"]) - before
+        session["bytes"] += change
+        self._bytes += change
+        return True
+
+    async def record_turn(self, session_id, context, *turns):
+        # Neither call awaits anything, so no other request runs in between
+        if not await self.update_context(session_id, context):
+            return False
+        return await self.append_history(session_id, *turns)
+
+    async def fold_history(self, session_id, turns, summary):
+        session = self._lookup(session_id)
+        if session is None:
+            return False
+        history = session["history"]
+        count = len(turns)
+        if history[:count] != list(turns):
+            return False
+        change = len(summary.encode("utf-8")) - len((session["summary"] or "").encode("utf-8"))
+        change -= sum(_turn_bytes(turn) for turn in history[:count])
+        del history[:count]
+        session["summary"] = summary
+        session["bytes"] += change
+        self._bytes += change
+        return True
+
+    async def delete(self, session_id):
+        if session_id in self._sessions:
+            self._drop(session_id)
+
+    async def sweep(self):
+        now = time.monotonic()
+        # Sessions are ordered by last use, so expired ones are at the front
+        expired = []
+        for session_id, session in self._sessions.items():
+            if not self._expired(session, now):
+                break
+            expired.append(session_id)
+        for session_id in expired:
+            self._drop(session_id)
+        self.expired += len(expired)
+        return len(expired)
+
+    async def stats(self):
+        return {
+            "backend": "memory",
+            "sessions": len(self._sessions),
+            "bytes": self._bytes,
+            "max_sessions": self.max_sessions,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Sessions in a SQLite file, shared by every worker on the same host.
+
+    Each history turn is one row holding a compact record, so appending a
+    turn never rewrites the rest of the conversation. Appends and their trim
+    run in one transaction. Every statement runs on one dedicated thread, so
+    waiting for another worker's write lock never blocks the event loop.
+    Reads take no write lock; last_seen is only bumped once it is
+    `touch_interval` seconds old.
+    """
+
+    shared = True
+
+    def __init__(self, path=DEFAULT_DB_PATH, **limits):
+        super().__init__(**limits)
+        self.path = path
+        self.touch_interval = min(60.0, self.ttl / 10)
+        # One thread owns the connection, which also serializes this worker's statements
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-sqlite")
+        self.conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " id TEXT PRIMARY KEY,"
+            " context TEXT NOT NULL DEFAULT '{}',"
+            " summary TEXT,"
+            " last_seen REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions (last_seen);"
+            "CREATE TABLE IF NOT EXISTS turns ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " session_id TEXT NOT NULL,"
+            " record TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS turns_session ON turns (session_id, seq);"
+        )
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(sessions)")]
+        if "summary" not in columns:
+            self.conn.execute("ALTER TABLE sessions ADD COLUMN summary TEXT")
+
+    async def _run(self, method, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, method, *args)
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front so concurrent workers queue instead of deadlocking
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def _touch(self, session_id):
+        """Bumps last_seen of a live session, returning False if it is missing or expired."""
+        now = time.time()
+        cursor = self.conn.execute(
+            "UPDATE sessions SET last_seen = ? WHERE id = ? AND last_seen >= ?",
+            (now, session_id, now - self.ttl),
+        )
+        return cursor.rowcount > 0
+
+    def _drop(self, where, params):
+        self.conn.execute(f"DELETE FROM turns WHERE session_id IN (SELECT id FROM sessions WHERE {where})", params)
+        return self.conn.execute(f"DELETE FROM sessions WHERE {where}", params).rowcount
+
+    def _get(self, session_id):
+        now = time.time()
+        conn = self.conn
+        # A deferred transaction reads one consistent snapshot without taking the write lock
+        conn.execute("BEGIN")
+        try:
+            row = conn.execute("SELECT context, summary, last_seen FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            if row is None or row[2] < now - self.ttl:
+                return None
+            records = conn.execute("SELECT record FROM turns WHERE session_id = ? ORDER BY seq", (session_id,)).fetchall()
+        finally:
+            conn.execute("COMMIT")
+
+        context, summary, last_seen = row
+        if now - last_seen > self.touch_interval:
+            conn.execute(
+                "UPDATE sessions SET last_seen = ? WHERE id = ? AND last_seen < ?",
+                (now, session_id, now),
+            )
+        return {
+            "history": [decode_turn(record) for record, in records],
+            "disease_context": json.loads(context),
+            "summary": summary,
+        }
+
+    def _create(self, session_id):
+        with self._transaction() as conn:
+            if not self._touch(session_id):
+                # Replace an expired session rather than resurrecting its history
+                self._drop("id = ?", (session_id,))
+                conn.execute("INSERT INTO sessions (id, last_seen) VALUES (?, ?)", (session_id, time.time()))
+                self._drop(
+                    "id IN (SELECT id FROM sessions ORDER BY last_seen DESC LIMIT -1 OFFSET ?)",
+                    (self.max_sessions,),
+                )
+        return session_id
+
+    def _append(self, session_id, turns):
+        self.conn.executemany(
+            "INSERT INTO turns (session_id, record) VALUES (?, ?)",
+            [(session_id, encode_turn(turn)) for turn in turns],
+        )
+        self.conn.execute(
+            "DELETE FROM turns WHERE session_id = ? AND seq NOT IN ("
+            " SELECT seq FROM turns WHERE session_id = ? ORDER BY seq DESC LIMIT ?)",
+            (session_id, session_id, self.max_history),
+        )
+
+    def _merge_context(self, session_id, context):
+        # Merged like dict.update, inside the caller's transaction; json_patch would drop keys set to None
+        (stored,) = self.conn.execute("SELECT context FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        self.conn.execute(
+            "UPDATE sessions SET context = ? WHERE id = ?",
+            (_dumps({**json.loads(stored), **context}), session_id),
+        )
+
+    def _record(self, session_id, context, turns):
+        with self._transaction():
+            if not self._touch(session_id):
+                return False
+            if context:
+                self._merge_context(session_id, context)
+            if turns:
+                self._append(session_id, turns)
+            return True
+
+    def _fold(self, session_id, turns, summary):
+        with self._transaction() as conn:
+            if not self._touch(session_id):
+                return False
+            oldest = conn.execute(
+                "SELECT seq, record FROM turns WHERE session_id = ? ORDER BY seq LIMIT ?",
+                (session_id, len(turns)),
+            ).fetchall()
+            if [record for _, record in oldest] != [encode_turn(turn) for turn in turns]:
+                return False
+            conn.executemany("DELETE FROM turns WHERE seq = ?", [(seq,) for seq, _ in oldest])
+            conn.execute("UPDATE sessions SET summary = ? WHERE id = ?", (summary, session_id))
+            return True
+
+    def _delete(self, where, params):
+        with self._transaction():
+            return self._drop(where, params)
+
+    def _stats(self):
+        sessions = self.conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        page_count = self.conn.execute("PRAGMA page_count").fetchone()[0]
+        page_size = self.conn.execute("PRAGMA page_size").fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "sessions": sessions,
+            "bytes": page_count * page_size,
+            "max_sessions": self.max_sessions,
+        }
+
+    async def get(self, session_id):
+        if not session_id:
+            return None
+        return await self._run(self._get, session_id)
+
+    async def create(self, session_id=None):
+        return await self._run(self._create, session_id or new_session_id())
+
+    async def append_history(self, session_id, *turns):
+        return await self._run(self._record, session_id, None, turns)
+
+    async def update_context(self, session_id, context):
+        return await self._run(self._record, session_id, context, ())
+
+    async def record_turn(self, session_id, context, *turns):
+        return await self._run(self._record, session_id, context, turns)
+
+    async def fold_history(self, session_id, turns, summary):
+        return await self._run(self._fold, session_id, turns, summary)
+
+    async def delete(self, session_id):
+        await self._run(self._delete, "id = ?", (session_id,))
+
+    async def sweep(self):
+        return await self._run(self._delete, "last_seen < ?", (time.time() - self.ttl,))
+
+    async def stats(self):
+        return await self._run(self._stats)
+
+    async def close(self):
+        await self._run(self.conn.close)
+        self._executor.shutdown()
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Sessions in Redis, shared by every worker and node.
+
+    A session is a hash `<prefix><id>` (disease context fields as compact
+    JSON) and a list `<prefix><id>:h` of compact turn records; both carry the
+    idle TTL as a Redis expiry, so Redis reclaims abandoned sessions itself.
+    A sorted set `<prefix>lru` of last-use times enforces max_sessions.
+    History appends run as one MULTI/EXEC of RPUSH + LTRIM + EXPIRE, and
+    record_turn() adds the context HSET to the same MULTI/EXEC. Folds WATCH
+    the history so they only apply to the turns that were summarized.
+    """
+
+    shared = True
+
+    # Hash fields that mark the session as existing even with an empty context, and hold the summary
+    CREATED = "_created"
+    SUMMARY = "_summary"
+
+    def __init__(self, url="redis://localhost:6379/0", prefix="krishi:session:", client=None, **limits):
+        super().__init__(**limits)
+        if client is None:
+            if aioredis is None:
+                raise RuntimeError("SESSION_BACKEND=redis needs the redis package: pip install redis")
+            client = aioredis.from_url(url, decode_responses=True)
+        self.redis = client
+        self.prefix = prefix
+        self.lru_key = f"{prefix}lru"
+        self.ttl_ms = int(self.ttl * 1000)
+
+    def _keys(self, session_id):
+        return f"{self.prefix}{session_id}", f"{self.prefix}{session_id}:h"
+
+    def _touch(self, pipe, session_id):
+        for key in self._keys(session_id):
+            pipe.pexpire(key, self.ttl_ms)
+        pipe.zadd(self.lru_key, {session_id: time.time()})
+
+    async def get(self, session_id):
+        if not session_id:
+            return None
+        key, history_key = self._keys(session_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hgetall(key)
+            pipe.lrange(history_key, 0, -1)
+            fields, records = await pipe.execute()
+        if not fields:
+            return None
+        async with self.redis.pipeline(transaction=False) as pipe:
+            self._touch(pipe, session_id)
+            await pipe.execute()
+        fields.pop(self.CREATED, None)
+        summary = fields.pop(self.SUMMARY, None)
+        return {
+            "history": [decode_turn(record) for record in records],
+            "disease_context": {name: json.loads(value) for name, value in fields.items()},
+            "summary": summary,
+        }
+
+    async def create(self, session_id=None):
+        session_id = session_id or new_session_id()
+        key, _ = self._keys(session_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hsetnx(key, self.CREATED, int(time.time()))
+            self._touch(pipe, session_id)
+            pipe.zcard(self.lru_key)
+            results = await pipe.execute()
+
+        overflow = results[-1] - self.max_sessions
+        if overflow > 0:
+            evicted = [member for member, _ in await self.redis.zpopmin(self.lru_key, overflow)]
+            if evicted:
+                await self.redis.delete(*[k for member in evicted for k in self._keys(member)])
+        return session_id
+
+    async def append_history(self, session_id, *turns):
+        return await self.record_turn(session_id, None, *turns)
+
+    async def update_context(self, session_id, context):
+        key, _ = self._keys(session_id)
+        if not context:
+            return bool(await self.redis.exists(key))
+        # HSET only writes to a live session; a missing key would otherwise be recreated
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.exists(key)
+            pipe.hset(key, mapping={name: _dumps(value) for name, value in context.items()})
+            self._touch(pipe, session_id)
+            exists, *_ = await pipe.execute()
+        if not exists:
+            await self.delete(session_id)
+        return bool(exists)
+
+    async def record_turn(self, session_id, context, *turns):
+        key, history_key = self._keys(session_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.exists(key)
+            if context:
+                pipe.hset(key, mapping={name: _dumps(value) for name, value in context.items()})
+            if turns:
+                pipe.rpush(history_key, *[encode_turn(turn) for turn in turns])
+                pipe.ltrim(history_key, -self.max_history, -1)
+            self._touch(pipe, session_id)
+            exists, *_ = await pipe.execute()
+        if not exists:
+            await self.delete(session_id)
+        return bool(exists)
+
+    async def fold_history(self, session_id, turns, summary):
+        key, history_key = self._keys(session_id)
+        expected = [encode_turn(turn) for turn in turns]
+        async with self.redis.pipeline(transaction=True) as pipe:
+            # WATCH makes the MULTI fail if the history changes between the check and the fold
+            await pipe.watch(history_key)
+            if await pipe.lrange(history_key, 0, len(expected) - 1) != expected:
+                return False
+            pipe.multi()
+            pipe.ltrim(history_key, len(expected), -1)
+            pipe.hset(key, self.SUMMARY, summary)
+            self._touch(pipe, session_id)
+            try:
+                await pipe.execute()
+            except aioredis.WatchError:
+                return False
+        return True
+
+    async def delete(self, session_id):
+        await self.redis.delete(*self._keys(session_id))
+        await self.redis.zrem(self.lru_key, session_id)
+
+    async def sweep(self):
+        # The session keys expire on their own; this only trims the LRU index
+        return await self.redis.zremrangebyscore(self.lru_key, "-inf", time.time() - self.ttl)
+
+    async def stats(self):
+        memory = await self.redis.info("memory")
+        return {
+            "backend": "redis",
+            "sessions": await self.redis.zcard(self.lru_key),
+            "bytes": memory.get("used_memory"),
+            "max_sessions": self.max_sessions,
+        }
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+def create_session_store(backend=None, **limits):
+    """
+    Builds the session store selected by `backend` or the SESSION_BACKEND
+    environment variable: "memory" (default), "sqlite" (SESSION_DB) or
+    "redis" (REDIS_URL).
+    """
+    backend = (backend or os.getenv("SESSION_BACKEND", "memory")).lower()
+    if backend == "memory":
+        return MemorySessionStore(**limits)
+    if backend == "sqlite":
+        return SQLiteSessionStore(DEFAULT_DB_PATH, **limits)
+    if backend == "redis":
+        return RedisSessionStore(os.getenv("REDIS_URL", "redis://localhost:6379/0"), **limits)
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
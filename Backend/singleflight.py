@@ -0,0 +1,67 @@
+import asyncio
+
+
+class _Call:
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one.
+
+    The first caller for a key starts factory() as a task; callers arriving
+    while it runs await the same task and get the same result or exception.
+    A caller that is cancelled only stops waiting: the shared call is
+    cancelled once every caller waiting on it is gone. Nothing is kept after
+    the call finishes, so results are never stale.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+        self.calls = 0
+        self.coalesced = 0
+        self.cancelled = 0
+        self.errors = 0
+
+    async def do(self, key, factory):
+        """Returns the result of factory(), shared with concurrent callers using the same key."""
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(factory()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda task: self._finished(key, call))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Nobody is left waiting; later callers start a fresh call
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                call.task.cancel()
+
+    def _finished(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if call.task.cancelled():
+            self.cancelled += 1
+        elif call.task.exception() is not None:
+            self.errors += 1
+
+    def metrics(self):
+        return {
+            "in_flight": len(self._calls),
+            "waiting": sum(call.waiters for call in self._calls.values()),
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "cancelled": self.cancelled,
+            "errors": self.errors,
+        }
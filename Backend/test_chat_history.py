@@ -0,0 +1,126 @@
+"""
+Cursors and keyset pagination of the chat history queries.
+
+    python -m unittest test_chat_history
+
+The queries run against mongomock and are skipped when it is not installed.
+"""
+import json
+import unittest
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+import chat_history
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+
+class AsyncCursor:
+    """The part of Motor's cursor API chat_history uses, over a mongomock cursor."""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def sort(self, keys):
+        self.cursor = self.cursor.sort(keys)
+        return self
+
+    def limit(self, count):
+        self.cursor = self.cursor.limit(count)
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    async def to_list(self, length):
+        return list(self.cursor)[:length]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.cursor:
+            yield doc
+
+
+class AsyncCollection:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def find(self, *args, **kwargs):
+        return AsyncCursor(self.collection.find(*args, **kwargs))
+
+
+class CursorTest(unittest.TestCase):
+    def test_cursor_round_trips(self):
+        doc = {"_id": ObjectId(), "created_at": datetime(2024, 3, 1, 12, 30, 5, 123000)}
+        self.assertEqual(chat_history.decode_cursor(chat_history.encode_cursor(doc)), (doc["created_at"], doc["_id"]))
+
+    def test_malformed_cursor_is_a_value_error(self):
+        for cursor in ("", "not-a-cursor", chat_history.encode_cursor({"_id": "x", "created_at": datetime.now()})):
+            with self.assertRaises(ValueError):
+                chat_history.decode_cursor(cursor)
+
+
+@unittest.skipIf(mongomock is None, "mongomock is not installed")
+class PaginationTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.raw = mongomock.MongoClient().db.chats
+        self.collection = AsyncCollection(self.raw)
+        start = datetime(2024, 3, 1, 12, 0, 0)
+        # Pairs of chats saved in the same millisecond, so pages split created_at ties
+        self.docs = [
+            {
+                "_id": ObjectId(),
+                "session_id": "s1",
+                "user_id": "u1",
+                "question": f"prompt {i}",
+                "user_question": f"question {i}",
+                "created_at": start + timedelta(milliseconds=i // 2),
+            }
+            for i in range(11)
+        ]
+        self.raw.insert_many([dict(doc) for doc in self.docs])
+        self.raw.insert_one({"_id": ObjectId(), "session_id": "s2", "user_question": "other", "created_at": start})
+
+    async def pages(self, limit, **filters):
+        items, cursor = [], None
+        # Bounded, so a cursor that never advances fails instead of hanging
+        for _ in range(len(self.docs) + 1):
+            page = await chat_history.fetch_page(self.collection, limit=limit, cursor=cursor, **filters)
+            self.assertLessEqual(len(page["items"]), limit)
+            items.extend(page["items"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return items
+        self.fail(f"Pagination with limit={limit} did not end")
+
+    def newest_first(self):
+        return [str(doc["_id"]) for doc in sorted(self.docs, key=lambda doc: (doc["created_at"], doc["_id"]), reverse=True)]
+
+    async def test_pages_neither_repeat_nor_skip_tied_chats(self):
+        for limit in (1, 2, 3, 4, 11, 20):
+            items = await self.pages(limit, session_id="s1")
+            self.assertEqual([item["id"] for item in items], self.newest_first(), f"limit={limit}")
+
+    async def test_pages_are_filtered_and_hide_the_prompt(self):
+        items = await self.pages(5, user_id="u1")
+        self.assertEqual(len(items), 11)
+        self.assertTrue(all(item["session_id"] == "s1" and "question" not in item for item in items))
+
+    async def test_a_session_or_user_is_required(self):
+        with self.assertRaises(ValueError):
+            await chat_history.fetch_page(self.collection)
+
+    async def test_export_is_oldest_first(self):
+        lines = [json.loads(line) async for line in chat_history.export_ndjson(self.collection, session_id="s1")]
+        self.assertEqual([line["id"] for line in lines], self.newest_first()[::-1])
+        self.assertNotIn("question", lines[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+"""
+Admission, queueing and slot release of LLMScheduler.
+
+    python -m unittest test_llm_scheduler
+"""
+import asyncio
+import unittest
+
+from llm_scheduler import LLMScheduler, SchedulerOverloaded
+
+
+class LLMSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.release = asyncio.Event()
+
+    async def call(self):
+        await self.release.wait()
+        return "answer"
+
+    async def test_callers_beyond_the_queue_are_rejected(self):
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=1, timeout=5)
+        running = asyncio.create_task(scheduler.run(self.call))
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(scheduler.run(self.call))
+        await asyncio.sleep(0)
+        self.assertEqual((scheduler.in_flight, scheduler.queued), (1, 1))
+
+        # This is what the endpoints turn into a 503
+        with self.assertRaises(SchedulerOverloaded):
+            await scheduler.run(self.call)
+        self.assertEqual(scheduler.metrics()["rejected"], 1)
+
+        self.release.set()
+        self.assertEqual(await asyncio.gather(running, queued), ["answer", "answer"])
+        self.assertEqual(scheduler.metrics()["completed"], 2)
+
+    async def test_slot_is_released_when_the_call_raises(self):
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=0, timeout=5)
+
+        async def failing():
+            raise RuntimeError("LLM down")
+
+        with self.assertRaises(RuntimeError):
+            await scheduler.run(failing)
+        self.assertEqual(scheduler.in_flight, 0)
+        self.assertEqual(scheduler.metrics()["errors"], 1)
+
+        self.release.set()
+        self.assertEqual(await scheduler.run(self.call), "answer")
+
+    async def test_slot_is_released_on_timeout(self):
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=0, timeout=0.05)
+        with self.assertRaises(asyncio.TimeoutError):
+            await scheduler.run(self.call)
+        self.assertEqual((scheduler.in_flight, scheduler.timeouts), (0, 1))
+
+        self.release.set()
+        self.assertEqual(await scheduler.run(self.call), "answer")
+
+    async def test_cancelled_waiter_leaves_the_queue(self):
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=1, timeout=5)
+        running = asyncio.create_task(scheduler.run(self.call))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(scheduler.run(self.call))
+        await asyncio.sleep(0)
+
+        waiter.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+        self.assertEqual(scheduler.queued, 0)
+
+        self.release.set()
+        await running
+        self.assertEqual(scheduler.in_flight, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,183 @@
+"""
+Behaviour shared by the memory, SQLite and Redis session stores.
+
+    python -m unittest test_session_store
+
+The Redis store is tested against fakeredis and skipped when it is not installed.
+"""
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from session_store import MemorySessionStore, RedisSessionStore, SQLiteSessionStore
+
+try:
+    import fakeredis.aioredis as fakeredis
+except ImportError:
+    fakeredis = None
+
+
+def turn(i):
+    return {"sender": "user" if i % 2 == 0 else "bot", "text": f"turn {i}"}
+
+
+class SessionStoreCases:
+    """Mixed into one TestCase per backend, which implements make_store()."""
+
+    async def asyncSetUp(self):
+        self.stores = []
+
+    async def asyncTearDown(self):
+        for store in self.stores:
+            await store.stop()
+
+    def store(self, **limits):
+        store = self.make_store(**{"ttl": 60, "max_sessions": 100, "max_history": 6, **limits})
+        self.stores.append(store)
+        return store
+
+    async def test_create_and_get(self):
+        store = self.store()
+        session_id = await store.create()
+        self.assertEqual(await store.create(session_id), session_id)
+        self.assertEqual(await store.get(session_id), {"history": [], "disease_context": {}, "summary": None})
+        self.assertIsNone(await store.get("unknown"))
+
+    async def test_history_is_trimmed_to_max_history(self):
+        store = self.store()
+        session_id = await store.create()
+        self.assertTrue(await store.append_history(session_id, *[turn(i) for i in range(8)]))
+        session = await store.get(session_id)
+        self.assertEqual(session["history"], [turn(i) for i in range(2, 8)])
+        self.assertFalse(await store.append_history("unknown", turn(0)))
+
+    async def test_record_turn_merges_context_and_appends(self):
+        store = self.store()
+        session_id = await store.create()
+        await store.record_turn(session_id, {"disease_name": "Late blight", "causes": ["fungus"]}, turn(0), turn(1))
+        await store.record_turn(session_id, {"causes": ["humidity"]}, turn(2), turn(3))
+        session = await store.get(session_id)
+        self.assertEqual(session["disease_context"], {"disease_name": "Late blight", "causes": ["humidity"]})
+        self.assertEqual(session["history"], [turn(i) for i in range(4)])
+        self.assertFalse(await store.record_turn("unknown", {"a": 1}, turn(0)))
+        self.assertIsNone(await store.get("unknown"))
+
+    async def test_context_merge_keeps_keys_set_to_none(self):
+        store = self.store()
+        session_id = await store.create()
+        await store.update_context(session_id, {"disease_name": "Late blight", "causes": ["fungus"], "symptoms": None})
+        await store.record_turn(session_id, {"causes": None, "solutions": ["copper spray"]}, turn(0))
+        session = await store.get(session_id)
+        self.assertEqual(session["disease_context"], {
+            "disease_name": "Late blight", "causes": None, "symptoms": None, "solutions": ["copper spray"],
+        })
+
+    async def test_fold_only_applies_to_the_summarized_turns(self):
+        store = self.store()
+        session_id = await store.create()
+        await store.append_history(session_id, *[turn(i) for i in range(8)])
+        # Turns 0 and 1 were already trimmed away
+        self.assertFalse(await store.fold_history(session_id, [turn(0), turn(1)], "stale"))
+
+        oldest = [turn(2), turn(3)]
+        results = await asyncio.gather(
+            store.fold_history(session_id, oldest, "first"),
+            store.fold_history(session_id, oldest, "second"),
+        )
+        self.assertEqual(sorted(results), [False, True])
+        session = await store.get(session_id)
+        self.assertEqual(session["summary"], "first" if results[0] else "second")
+        self.assertEqual(session["history"], [turn(i) for i in range(4, 8)])
+
+    async def test_idle_sessions_expire(self):
+        store = self.store(ttl=0.2)
+        session_id = await store.create()
+        await store.append_history(session_id, turn(0))
+        await asyncio.sleep(0.3)
+        self.assertIsNone(await store.get(session_id))
+        self.assertFalse(await store.append_history(session_id, turn(1)))
+        # Recreating an expired id starts an empty session
+        await store.create(session_id)
+        self.assertEqual((await store.get(session_id))["history"], [])
+
+    async def test_least_recently_used_session_is_evicted(self):
+        store = self.store(max_sessions=2)
+        first = await store.create()
+        await asyncio.sleep(0.01)
+        second = await store.create()
+        await asyncio.sleep(0.01)
+        await store.create(first)
+        await asyncio.sleep(0.01)
+        third = await store.create()
+        self.assertIsNone(await store.get(second))
+        self.assertIsNotNone(await store.get(first))
+        self.assertIsNotNone(await store.get(third))
+
+
+class MemorySessionStoreTest(SessionStoreCases, unittest.IsolatedAsyncioTestCase):
+    def make_store(self, **limits):
+        return MemorySessionStore(**limits)
+
+    async def test_sweep_drops_expired_sessions(self):
+        store = self.store(ttl=0.1)
+        await store.create()
+        await asyncio.sleep(0.2)
+        self.assertEqual(await store.sweep(), 1)
+        self.assertEqual((await store.stats())["sessions"], 0)
+
+
+class SQLiteSessionStoreTest(SessionStoreCases, unittest.IsolatedAsyncioTestCase):
+    def make_store(self, **limits):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "sessions.sqlite3")
+        return SQLiteSessionStore(self.path, **limits)
+
+    async def test_sweep_drops_expired_sessions(self):
+        store = self.store(ttl=0.1)
+        await store.create()
+        await asyncio.sleep(0.2)
+        self.assertEqual(await store.sweep(), 1)
+        self.assertEqual((await store.stats())["sessions"], 0)
+
+    async def test_waiting_for_the_write_lock_does_not_block_the_loop(self):
+        store = self.store()
+        session_id = await store.create()
+
+        # Another worker holds the write lock for a while
+        other = sqlite3.connect(self.path, isolation_level=None)
+        self.addCleanup(other.close)
+        other.execute("BEGIN IMMEDIATE")
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.3, other.execute, "COMMIT")
+
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        start = time.monotonic()
+        # Reads go through while the lock is held
+        self.assertIsNotNone(await store.get(session_id))
+        self.assertLess(time.monotonic() - start, 0.2)
+        # Writes wait for it, on the store's thread
+        self.assertTrue(await store.append_history(session_id, turn(0)))
+        ticker.cancel()
+        self.assertGreater(ticks, 10)
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis is not installed")
+class RedisSessionStoreTest(SessionStoreCases, unittest.IsolatedAsyncioTestCase):
+    def make_store(self, **limits):
+        return RedisSessionStore(client=fakeredis.FakeRedis(decode_responses=True), **limits)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+"""
+Coalescing, cancellation and error behaviour of SingleFlight.
+
+    python -m unittest test_singleflight
+"""
+import asyncio
+import unittest
+
+from singleflight import SingleFlight
+
+
+class SingleFlightTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.flight = SingleFlight()
+        self.started = 0
+        self.release = asyncio.Event()
+
+    async def factory(self):
+        self.started += 1
+        await self.release.wait()
+        return f"answer {self.started}"
+
+    async def test_concurrent_calls_share_one_call(self):
+        callers = [asyncio.create_task(self.flight.do("key", self.factory)) for _ in range(5)]
+        other = asyncio.create_task(self.flight.do("other", self.factory))
+        await asyncio.sleep(0)
+        self.release.set()
+
+        self.assertEqual(await asyncio.gather(*callers), ["answer 1"] * 5)
+        await other
+        self.assertEqual(self.started, 2)
+        metrics = self.flight.metrics()
+        self.assertEqual((metrics["calls"], metrics["coalesced"], metrics["in_flight"]), (2, 4, 0))
+
+    async def test_finished_calls_are_not_reused(self):
+        self.release.set()
+        self.assertEqual(await self.flight.do("key", self.factory), "answer 1")
+        self.assertEqual(await self.flight.do("key", self.factory), "answer 2")
+
+    async def test_cancelled_leader_does_not_cancel_the_others(self):
+        leader = asyncio.create_task(self.flight.do("key", self.factory))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(self.flight.do("key", self.factory))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await leader
+        self.release.set()
+        self.assertEqual(await follower, "answer 1")
+        self.assertEqual(self.started, 1)
+        self.assertEqual(self.flight.metrics()["cancelled"], 0)
+
+    async def test_call_is_cancelled_once_every_caller_is_gone(self):
+        callers = [asyncio.create_task(self.flight.do("key", self.factory)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0)
+        self.assertEqual(self.flight.metrics()["cancelled"], 1)
+
+        # The next caller starts a fresh call
+        self.release.set()
+        self.assertEqual(await self.flight.do("key", self.factory), "answer 2")
+
+    async def test_errors_reach_every_caller_and_are_not_cached(self):
+        async def failing():
+            self.started += 1
+            await self.release.wait()
+            raise RuntimeError("LLM down")
+
+        callers = [asyncio.create_task(self.flight.do("key", failing)) for _ in range(3)]
+        await asyncio.sleep(0)
+        self.release.set()
+        results = await asyncio.gather(*callers, return_exceptions=True)
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+        self.assertEqual(self.started, 1)
+        self.assertEqual(self.flight.metrics()["errors"], 1)
+
+        self.assertEqual(await self.flight.do("key", self.factory), "answer 2")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+"""
+Freshness, stale-while-revalidate and fetch deduplication of WeatherCache.
+
+    python -m unittest test_weather_cache
+"""
+import asyncio
+import unittest
+
+from weather_cache import WeatherCache
+
+
+class WeatherCacheTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.fetches = []
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def fetch(self, latitude, longitude):
+        self.fetches.append((latitude, longitude))
+        await self.release.wait()
+        return f"weather {len(self.fetches)}"
+
+    async def test_fresh_entries_are_shared_by_the_cell(self):
+        cache = WeatherCache(self.fetch, ttl=60, precision=2)
+        self.assertEqual(await cache.get(30.9012, 75.8534), "weather 1")
+        self.assertEqual(await cache.get(30.9049, 75.8499), "weather 1")
+        self.assertEqual(self.fetches, [(30.9, 75.85)])
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    async def test_concurrent_misses_share_one_fetch(self):
+        cache = WeatherCache(self.fetch, ttl=60)
+        self.release.clear()
+        callers = [asyncio.create_task(cache.get(30.9, 75.85)) for _ in range(5)]
+        await asyncio.sleep(0)
+        self.release.set()
+        self.assertEqual(await asyncio.gather(*callers), ["weather 1"] * 5)
+        self.assertEqual(len(self.fetches), 1)
+
+    async def test_stale_entry_is_served_while_it_revalidates(self):
+        cache = WeatherCache(self.fetch, ttl=0.05, stale_ttl=60)
+        await cache.get(30.9, 75.85)
+        await asyncio.sleep(0.1)
+
+        self.release.clear()
+        # Served at once from the stale entry; only one refresh starts
+        self.assertEqual(await cache.get(30.9, 75.85), "weather 1")
+        self.assertEqual(await cache.get(30.9, 75.85), "weather 1")
+        await asyncio.sleep(0)
+        self.assertEqual(len(self.fetches), 2)
+        self.assertEqual((cache.stale_hits, cache.refreshes), (2, 1))
+
+        self.release.set()
+        await asyncio.sleep(0.01)
+        self.assertEqual(await cache.get(30.9, 75.85), "weather 2")
+        self.assertEqual(cache.stats()["inflight"], 0)
+
+    async def test_expired_entry_waits_for_the_fetch(self):
+        cache = WeatherCache(self.fetch, ttl=0.05, stale_ttl=0)
+        await cache.get(30.9, 75.85)
+        await asyncio.sleep(0.1)
+        self.assertEqual(await cache.get(30.9, 75.85), "weather 2")
+
+    async def test_failed_fetch_is_not_cached(self):
+        async def failing(latitude, longitude):
+            self.fetches.append((latitude, longitude))
+            raise OSError("API down")
+
+        cache = WeatherCache(failing, ttl=60)
+        self.assertIsNone(await cache.get(30.9, 75.85))
+        self.assertIsNone(await cache.get(30.9, 75.85))
+        self.assertEqual((len(self.fetches), cache.errors), (2, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
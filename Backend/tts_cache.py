@@ -0,0 +1,297 @@
+import asyncio
+import hashlib
+import os
+import re
+import threading
+from collections import deque
+
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+
+# Bytes read per chunk when streaming a cached file
+CHUNK_SIZE = 64 * 1024
+
+# Target length of a streamed TTS segment in characters
+SEGMENT_CHARS = 200
+
+# Sentence ends, including the Devanagari/Gurmukhi danda
+SENTENCE_END = re.compile(r"(?<=[.!?।॥])\s+")
+
+
+def audio_key(text, lang, tld, slow):
+    """Content address of a synthesized clip: hash of the text hash and the voice settings."""
+    text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return hashlib.sha256(f"{text_hash}|{lang}|{tld}|{int(bool(slow))}".encode("utf-8")).hexdigest()
+
+
+class TTSAudioCache:
+    """
+    Content-addressed on-disk MP3 cache with a total size bound.
+
+    Files are named by audio_key(). A file's mtime is bumped on every hit and
+    the least recently used files are deleted once the directory grows past
+    `max_bytes`. Concurrent requests for the same missing clip share one
+    synthesis. Synthesis runs on `executor` (the loop's default executor if
+    None), which bounds how many clips are synthesized at once; the size
+    bookkeeping shared by those threads is guarded by a lock. Clips being
+    fetched by open_or_create() are pinned so eviction skips them until they
+    are open, and an open clip stays readable even if it is evicted while
+    being sent.
+    """
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, executor=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.executor = executor
+        os.makedirs(directory, exist_ok=True)
+
+        self._sizes = {}
+        for name in os.listdir(directory):
+            if name.endswith(".mp3"):
+                self._sizes[name[:-4]] = os.path.getsize(os.path.join(directory, name))
+        self._lock = threading.Lock()
+        self._pins = {}
+        self._inflight = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.mp3")
+
+    def contains(self, key):
+        return key in self._sizes and os.path.exists(self.path(key))
+
+    def touch(self, key):
+        try:
+            os.utime(self.path(key))
+        except FileNotFoundError:
+            with self._lock:
+                self._sizes.pop(key, None)
+
+    def open(self, key):
+        """Opens the cached clip for reading, or returns None if it is not cached."""
+        with self._lock:
+            if key not in self._sizes:
+                return None
+            try:
+                return open(self.path(key), "rb")
+            except FileNotFoundError:
+                self._sizes.pop(key, None)
+                return None
+
+    def _pin(self, key, delta):
+        with self._lock:
+            count = self._pins.get(key, 0) + delta
+            if count > 0:
+                self._pins[key] = count
+            else:
+                self._pins.pop(key, None)
+                # Evictions skipped while the clip was pinned
+                self._evict()
+
+    async def open_or_create(self, key, synthesize):
+        """
+        Like get_or_create(), but returns the clip opened for reading (in a
+        worker thread). The key is pinned from before the lookup until the
+        file is open, so other clips' synthesis cannot evict it in between.
+        """
+        self._pin(key, 1)
+        try:
+            await self.get_or_create(key, synthesize)
+            file = await asyncio.to_thread(self.open, key)
+        finally:
+            self._pin(key, -1)
+        if file is None:
+            raise FileNotFoundError(f"TTS clip {key} disappeared before it could be served")
+        return file
+
+    async def get_or_create(self, key, synthesize):
+        """
+        Returns the path of the cached clip, calling synthesize(file) in a worker
+        thread to write the MP3 into a binary file object on a miss.
+        """
+        if self.contains(key):
+            self.hits += 1
+            self.touch(key)
+            return self.path(key)
+
+        self.misses += 1
+        task = self._inflight.get(key)
+        if task is None:
+            loop = asyncio.get_running_loop()
+            task = asyncio.ensure_future(loop.run_in_executor(self.executor, self._create, key, synthesize))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    def _create(self, key, synthesize):
+        path = self.path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as file:
+                synthesize(file)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        size = os.path.getsize(path)
+        with self._lock:
+            self._sizes[key] = size
+            self._evict()
+        return path
+
+    def _evict(self):
+        # Called with self._lock held
+        total = sum(self._sizes.values())
+        if total <= self.max_bytes:
+            return
+
+        def last_used(key):
+            try:
+                return os.path.getmtime(self.path(key))
+            except FileNotFoundError:
+                return 0
+
+        for key in sorted(self._sizes, key=last_used):
+            if total <= self.max_bytes:
+                break
+            if key in self._pins:
+                continue
+            total -= self._sizes.pop(key, 0)
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            files, total = len(self._sizes), sum(self._sizes.values())
+        return {
+            "files": files,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def split_segments(text, max_chars=SEGMENT_CHARS):
+    """
+    Splits text into sentence-aligned segments of at most about max_chars,
+    merging short sentences and breaking overlong ones at spaces.
+    """
+    segments = []
+    current = ""
+    for sentence in SENTENCE_END.split(text.strip()):
+        sentence = sentence.strip()
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if current:
+                segments.append(current)
+                current = ""
+            segments.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if not sentence:
+            continue
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            segments.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        segments.append(current)
+    return segments
+
+
+def _read_all(file):
+    with file:
+        return file.read()
+
+
+async def stream_clips(cache, jobs, lookahead=4):
+    """
+    Yields the MP3 bytes of each (key, synthesize) job in order, keeping up to
+    `lookahead` jobs synthesizing ahead of the one being sent. Clips are read
+    in worker threads. Pending jobs are cancelled if the consumer stops early.
+    """
+    jobs = iter(jobs)
+    pending = deque()
+
+    async def clip(key, synthesize):
+        file = await cache.open_or_create(key, synthesize)
+        return await asyncio.to_thread(_read_all, file)
+
+    def schedule():
+        for key, synthesize in jobs:
+            pending.append(asyncio.ensure_future(clip(key, synthesize)))
+            return
+
+    try:
+        for _ in range(max(1, lookahead)):
+            schedule()
+        while pending:
+            data = await pending.popleft()
+            schedule()
+            yield data
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def _iter_file(file, start, length):
+    # A sync iterator, so StreamingResponse reads it in its threadpool
+    with file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def audio_response(request: Request, file, key, filename="tts_output.mp3", max_age=86400):
+    """
+    Serves a clip opened with TTSAudioCache.open() with ETag revalidation
+    (304 on If-None-Match) and single byte-range requests (206 / 416). The
+    file is closed once it has been sent.
+    """
+    etag = f'"{key}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": f"public, max-age={max_age}",
+        "Content-Disposition": f"inline; filename={filename}",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+        file.close()
+        return Response(status_code=304, headers=headers)
+
+    size = os.fstat(file.fileno()).st_size
+    range_header = request.headers.get("range")
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", range_header.strip()) if range_header else None
+
+    if match and (match.group(1) or match.group(2)):
+        if match.group(1):
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else size - 1
+        else:
+            start = max(size - int(match.group(2)), 0)
+            end = size - 1
+        end = min(end, size - 1)
+
+        if start > end:
+            file.close()
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+        length = end - start + 1
+        headers.update({"Content-Range": f"bytes {start}-{end}/{size}", "Content-Length": str(length)})
+        return StreamingResponse(_iter_file(file, start, length), status_code=206, media_type="audio/mpeg", headers=headers)
+
+    headers["Content-Length"] = str(size)
+    return StreamingResponse(_iter_file(file, 0, size), media_type="audio/mpeg", headers=headers)
@@ -0,0 +1,98 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class WeatherCache:
+    """
+    Location-keyed TTL cache with stale-while-revalidate for async fetchers.
+
+    Coordinates are rounded to `precision` decimals (2 decimals is a ~1 km
+    cell) and the fetcher is called with the cell's coordinates, so everyone
+    in the same cell shares one entry. Entries younger than `ttl` are served
+    as-is. Entries up to `ttl + stale_ttl` old are served immediately while a
+    background task refreshes them. Older entries, and misses, wait for the
+    fetch; concurrent misses for the same cell share a single fetch.
+    """
+
+    def __init__(self, fetch, ttl=600, stale_ttl=3600, maxsize=1024, precision=2):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.maxsize = maxsize
+        self.precision = precision
+
+        self._entries = OrderedDict()  # key -> (fetched_at, value)
+        self._inflight = {}  # key -> asyncio.Task
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.errors = 0
+
+    def key(self, latitude, longitude):
+        return round(float(latitude), self.precision), round(float(longitude), self.precision)
+
+    async def get(self, latitude, longitude):
+        key = self.key(latitude, longitude)
+        entry = self._entries.get(key)
+
+        if entry is not None:
+            fetched_at, value = entry
+            age = time.monotonic() - fetched_at
+            if age < self.ttl:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return value
+            if age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self._entries.move_to_end(key)
+                if key not in self._inflight:
+                    self.refreshes += 1
+                    self._start_fetch(key)
+                return value
+
+        self.misses += 1
+        task = self._inflight.get(key) or self._start_fetch(key)
+        return await asyncio.shield(task)
+
+    def _start_fetch(self, key):
+        task = asyncio.ensure_future(self._fetch_and_store(key))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return task
+
+    async def _fetch_and_store(self, key):
+        try:
+            value = await self.fetch(*key)
+        except Exception as e:
+            print(f" Weather fetch failed for {key}: {e}")
+            value = None
+
+        if value is None:
+            self.errors += 1
+            return None
+
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, latitude, longitude):
+        self._entries.pop(self.key(latitude, longitude), None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "errors": self.errors,
+            "inflight": len(self._inflight),
+        }
@@ -0,0 +1,140 @@
+"""
+Pluggable location, current-weather and climatology providers.
+
+Weather.py talks to the external APIs through a WeatherProvider. Besides
+the live provider defined there, this module has a recording provider that
+captures live responses to a JSON fixture, and a replay provider that
+serves a fixture locally with configurable latency and failure injection,
+so the ask pipeline can be benchmarked without network access.
+
+Select one with WEATHER_PROVIDER=live|record|replay and WEATHER_FIXTURE.
+"""
+import asyncio
+import json
+import os
+import random
+
+
+class ProviderError(Exception):
+    """Raised by providers when a lookup fails (including injected failures)."""
+
+
+class WeatherProvider:
+    # Whether Weather.get_climatology may answer from the local climatology store
+    # instead of asking the provider
+    use_climatology_store = True
+
+    async def locate(self):
+        """Returns (latitude, longitude) of the server."""
+        raise NotImplementedError
+
+    async def current(self, latitude, longitude):
+        """Returns (city, temperature, weather_desc, humidity)."""
+        raise NotImplementedError
+
+    async def climatology(self, latitude, longitude):
+        """Returns the PRECTOTCORR monthly climatology dict (JAN..DEC, ANN in mm/day)."""
+        raise NotImplementedError
+
+
+def location_key(latitude, longitude):
+    return f"{float(latitude):.4f},{float(longitude):.4f}"
+
+
+def load_fixture(path):
+    if not os.path.exists(path):
+        return {"locate": None, "current": {}, "climatology": {}}
+    with open(path, "r") as file:
+        return json.load(file)
+
+
+class RecordingWeatherProvider(WeatherProvider):
+    """Forwards every call to `inner` and saves each response into the fixture file."""
+
+    use_climatology_store = False
+
+    def __init__(self, inner, path):
+        self.inner = inner
+        self.path = path
+        self.fixture = load_fixture(path)
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(self.fixture, file, indent=2)
+        os.replace(tmp_path, self.path)
+
+    async def locate(self):
+        location = await self.inner.locate()
+        self.fixture["locate"] = list(location)
+        self._save()
+        return location
+
+    async def current(self, latitude, longitude):
+        weather = await self.inner.current(latitude, longitude)
+        self.fixture["current"][location_key(latitude, longitude)] = list(weather)
+        self._save()
+        return weather
+
+    async def climatology(self, latitude, longitude):
+        rainfall_data = await self.inner.climatology(latitude, longitude)
+        self.fixture["climatology"][location_key(latitude, longitude)] = rainfall_data
+        self._save()
+        return rainfall_data
+
+
+class ReplayWeatherProvider(WeatherProvider):
+    """
+    Serves recorded responses from a fixture file.
+
+    Every call sleeps `latency` seconds plus uniform jitter in [0, jitter) and
+    fails with ProviderError with probability `failure_rate`. Locations that
+    were not recorded are answered with the nearest recorded location.
+    """
+
+    use_climatology_store = False
+
+    def __init__(self, path, latency=0.0, jitter=0.0, failure_rate=0.0, seed=None):
+        self.fixture = load_fixture(path)
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.failures = 0
+
+    async def _simulate(self, name):
+        self.calls += 1
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            self.failures += 1
+            raise ProviderError(f"Injected {name} failure")
+
+    def _lookup(self, name, latitude, longitude):
+        recorded = self.fixture.get(name) or {}
+        key = location_key(latitude, longitude)
+        if key in recorded:
+            return recorded[key]
+        if not recorded:
+            raise ProviderError(f"No recorded {name} responses")
+
+        def distance(other):
+            lat, lon = (float(x) for x in other.split(","))
+            return (lat - latitude) ** 2 + (lon - longitude) ** 2
+        return recorded[min(recorded, key=distance)]
+
+    async def locate(self):
+        await self._simulate("locate")
+        if not self.fixture.get("locate"):
+            raise ProviderError("No recorded location")
+        return tuple(self.fixture["locate"])
+
+    async def current(self, latitude, longitude):
+        await self._simulate("current")
+        return tuple(self._lookup("current", latitude, longitude))
+
+    async def climatology(self, latitude, longitude):
+        await self._simulate("climatology")
+        return self._lookup("climatology", latitude, longitude)